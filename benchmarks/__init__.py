@@ -0,0 +1,80 @@
+"""
+Benchmarks of the bulk management commands and of the pages.
+
+Every benchmark runs against a throwaway test database, seeds it and reports
+rows per second and the peak of Python memory, e.g.::
+
+    python -m benchmarks.export --rows 100000
+
+or the throughput and latency of every public URL, see ``benchmarks.load``.
+"""
+import contextlib
+import os
+import time
+import tracemalloc
+
+import django
+
+
+def setup():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    django.setup()
+
+
+@contextlib.contextmanager
+def test_database():
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    old_config = runner.setup_databases()
+    try:
+        yield
+    finally:
+        runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+@contextlib.contextmanager
+def measure(label, rows):
+    tracemalloc.start()
+    started = time.monotonic()
+    try:
+        yield
+    finally:
+        elapsed = time.monotonic() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{label}: {rows} rows in {elapsed:.2f}s, {rows / elapsed:.0f} rows/s, peak {peak / 2 ** 20:.1f} MiB')
+
+
+def seed(posts, users=100, groups=10, follows=10, comments=1):
+    """``posts`` posts with ``comments`` comments each, every user follows the next ``follows`` users."""
+    from django.contrib.auth import get_user_model
+    from posts.models import Post, Group, Comment, Follow
+
+    User = get_user_model()
+    User.objects.bulk_create(User(username=f'user{i}') for i in range(users))
+    Group.objects.bulk_create(Group(title=f'Group {i}', slug=f'group{i}', description='') for i in range(groups))
+    user_ids = list(User.objects.order_by('pk').values_list('pk', flat=True))
+    group_ids = list(Group.objects.order_by('pk').values_list('pk', flat=True))
+    Post.objects.bulk_create(
+        (
+            Post(text=f'Post {i} ' * 10, author_id=user_ids[i % users], group_id=group_ids[i % groups] if i % 3 else None)
+            for i in range(posts)
+        )
+    )
+    Comment.objects.bulk_create(
+        (
+            Comment(text=f'Comment {i}', author_id=user_ids[(i + number + 1) % users], post_id=post_id)
+            for i, post_id in enumerate(Post.objects.values_list('pk', flat=True).iterator())
+            for number in range(comments)
+        )
+    )
+    Follow.objects.bulk_create(
+        (
+            Follow(user_id=user_id, author_id=user_ids[(i + step) % users])
+            for i, user_id in enumerate(user_ids) for step in range(1, min(follows, users - 1) + 1)
+        )
+    )
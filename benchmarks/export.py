@@ -0,0 +1,32 @@
+"""Throughput of ``manage.py export_posts`` for every dataset and format."""
+import argparse
+import tempfile
+from io import StringIO
+
+from benchmarks import measure, seed, setup, test_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000, help='Posts (and comments) to seed')
+    parser.add_argument('--gzip', action='store_true', help='Compress the output')
+    args = parser.parse_args()
+
+    setup()
+    from django.core.management import call_command
+    from posts.bulk import DATASETS, FORMATS
+
+    with test_database():
+        seed(args.rows)
+        for name, dataset in DATASETS.items():
+            rows = dataset.model.objects.count()
+            for output_format in FORMATS:
+                with tempfile.NamedTemporaryFile() as output, measure(f'export {name} as {output_format}', rows):
+                    call_command(
+                        'export_posts', name, format=output_format, output=output.name, gzip=args.gzip,
+                        stderr=StringIO(),
+                    )
+
+
+if __name__ == '__main__':
+    main()
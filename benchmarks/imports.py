@@ -0,0 +1,40 @@
+"""Throughput of ``manage.py import_posts``: a seeded database is exported, emptied and loaded back."""
+import argparse
+import os
+import tempfile
+from io import StringIO
+
+from benchmarks import measure, seed, setup, test_database
+
+# In the order the datasets reference each other.
+DATASETS = ('posts', 'comments', 'follows')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000, help='Posts (and comments) to seed')
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    parser.add_argument('--chunk-size', type=int, default=500, help='Rows inserted in one transaction')
+    args = parser.parse_args()
+
+    setup()
+    from django.core.management import call_command
+    from posts.bulk import DATASETS as EXPORTED
+
+    with test_database(), tempfile.TemporaryDirectory() as directory:
+        seed(args.rows)
+        paths = {name: os.path.join(directory, f'{name}.{args.format}') for name in DATASETS}
+        for name in DATASETS:
+            call_command('export_posts', name, format=args.format, output=paths[name], stderr=StringIO())
+        rows = {name: EXPORTED[name].model.objects.count() for name in DATASETS}
+        for name in reversed(DATASETS):
+            EXPORTED[name].model.objects.all().delete()
+        for name in DATASETS:
+            with measure(f'import {name} from {args.format}', rows[name]):
+                call_command(
+                    'import_posts', name, input=paths[name], chunk_size=args.chunk_size, stderr=StringIO(),
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,217 @@
+"""
+Throughput, latency percentiles and queries per request of every public URL,
+driven through the WSGI handler by concurrent clients, e.g.::
+
+    python -m benchmarks.load --posts 20000 --users 1000 --output after.json --baseline before.json
+
+The database is seeded with the given volumes, the counters, timelines and
+search index are built, and every URL is requested from a sample of the
+seeded users, groups and posts, chosen by ``--seed``. The cache is warmed by
+one pass over the URLs first. With ``--baseline``, a URL whose throughput
+falls or whose p95 latency grows by more than ``--threshold`` percent, or
+which runs more queries per request, is reported as a regression and the
+command exits with status 1.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import StringIO
+
+import django
+
+from benchmarks import seed, setup, test_database
+
+# Name: (path pattern, whether the viewer is logged in).
+URLS = {
+    'index': ('/', False),
+    'index_page': ('/?page={page}', False),
+    'follow': ('/follow/', True),
+    'group': ('/group/{slug}/', False),
+    'profile': ('/{username}/', False),
+    'post': ('/{username}/{post_id}/', False),
+    'post_comments': ('/{username}/{post_id}/comments/', False),
+    'search': ('/search/?q=post+{number}', False),
+    'index_feed': ('/feeds/rss/', False),
+    'api_posts': ('/api/v1/posts/', False),
+}
+
+
+def get_samples(rng, count):
+    """Path parameters of ``count`` random users, groups and posts."""
+    from django.contrib.auth import get_user_model
+    from posts.models import Group, Post
+
+    user_ids = list(get_user_model().objects.values_list('pk', flat=True))
+    slugs = list(Group.objects.values_list('slug', flat=True))
+    post_ids = rng.sample(list(Post.objects.values_list('pk', flat=True)), min(count, Post.objects.count()))
+    posts = Post.objects.select_related('author').in_bulk(post_ids)
+    return [
+        {
+            'user_id': rng.choice(user_ids),
+            'page': rng.randint(2, 10),
+            'slug': rng.choice(slugs),
+            'username': posts[post_id].author.username,
+            'post_id': post_id,
+            'number': rng.randint(0, 100),
+        }
+        for post_id in post_ids
+    ]
+
+
+def get_session_cookies(user_ids):
+    from django.conf import settings
+    from django.contrib.auth import get_user_model
+    from django.test import Client
+
+    cookies = {}
+    for user in get_user_model().objects.filter(pk__in=user_ids):
+        client = Client()
+        client.force_login(user)
+        cookies[user.pk] = f'{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}'
+    return cookies
+
+
+def get_requests(name, samples, cookies):
+    pattern, logged_in = URLS[name]
+    return [
+        (pattern.format(**sample), cookies[sample['user_id']] if logged_in else '')
+        for sample in samples
+    ]
+
+
+def run(handler, requests, count, concurrency):
+    """Latencies in seconds, query counts and statuses of ``count`` requests."""
+    from django.test import RequestFactory
+    from posts import timing
+
+    factory = RequestFactory()
+
+    def get(index):
+        path, cookie = requests[index % len(requests)]
+        environ = factory.get(path, HTTP_COOKIE=cookie).environ
+        statuses = []
+        timings = timing.start()
+        started = time.perf_counter()
+        try:
+            response = handler(environ, lambda status, headers: statuses.append(status))
+            b''.join(response)
+            response.close()
+        finally:
+            timing.stop()
+        return time.perf_counter() - started, timings.queries, int(statuses[0].split()[0])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(get, range(count)))
+
+
+def summarize(results, elapsed):
+    latencies = sorted(latency for latency, _, _ in results)
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': len(results),
+        'errors': sum(status >= 400 for _, _, status in results),
+        'throughput': round(len(results) / elapsed, 1),
+        'p50_ms': round(percentiles[49] * 1000, 2),
+        'p95_ms': round(percentiles[94] * 1000, 2),
+        'p99_ms': round(percentiles[98] * 1000, 2),
+        'queries': round(statistics.mean(queries for _, queries, _ in results), 2),
+    }
+
+
+def find_regressions(results, baseline, threshold):
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['throughput'] < before['throughput'] * (1 - threshold / 100):
+            regressions.append(f'{name}: throughput {before["throughput"]} -> {result["throughput"]} requests/s')
+        if result['p95_ms'] > before['p95_ms'] * (1 + threshold / 100):
+            regressions.append(f'{name}: p95 {before["p95_ms"]} -> {result["p95_ms"]} ms')
+        if result['queries'] > before['queries']:
+            regressions.append(f'{name}: {before["queries"]} -> {result["queries"]} queries per request')
+    return regressions
+
+
+def benchmark(args):
+    from django.conf import settings
+    from django.core.cache import cache
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.core.management import call_command
+
+    # Every request is timed by the benchmark itself.
+    settings.POSTS_TIMING_SAMPLE_RATE = 0
+
+    rng = random.Random(args.seed)
+    results = {}
+    with test_database(), tempfile.TemporaryDirectory() as metrics_dir:
+        settings.POSTS_METRICS_DIR = metrics_dir
+        seed(args.posts, users=args.users, groups=args.groups, follows=args.follows, comments=args.comments)
+        for command in ('recount', 'rebuild_timelines', 'rebuild_search_index'):
+            call_command(command, stdout=StringIO(), stderr=StringIO())
+        samples = get_samples(rng, args.samples)
+        cookies = get_session_cookies({sample['user_id'] for sample in samples})
+        handler = WSGIHandler()
+
+        print(f'{"url":<14} {"requests/s":>10} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"errors":>6}')
+        for name in args.urls:
+            requests = get_requests(name, samples, cookies)
+            cache.clear()
+            run(handler, requests, len(requests), args.concurrency)
+            started = time.perf_counter()
+            measured = run(handler, requests, args.requests, args.concurrency)
+            results[name] = summarize(measured, time.perf_counter() - started)
+            result = results[name]
+            print(
+                f'{name:<14} {result["throughput"]:>10} {result["p50_ms"]:>8} {result["p95_ms"]:>8} '
+                f'{result["p99_ms"]:>8} {result["queries"]:>8} {result["errors"]:>6}'
+            )
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--posts', type=int, default=10000)
+    parser.add_argument('--groups', type=int, default=20)
+    parser.add_argument('--follows', type=int, default=20, help='Authors every user follows')
+    parser.add_argument('--comments', type=int, default=2, help='Comments of every post')
+    parser.add_argument('--urls', nargs='+', choices=list(URLS), default=list(URLS))
+    parser.add_argument('--requests', type=int, default=500, help='Requests per URL')
+    parser.add_argument('--concurrency', type=int, default=8, help='Clients requesting at once')
+    parser.add_argument('--samples', type=int, default=50, help='Users, groups and posts the URLs are built from')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the sampling')
+    parser.add_argument('--output', help='JSON file the results are written to')
+    parser.add_argument('--baseline', help='JSON file of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=10, help='Regression threshold in percent')
+    args = parser.parse_args()
+
+    setup()
+    results = benchmark(args)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'options': vars(args),
+                'environment': {
+                    'python': platform.python_version(), 'django': django.get_version(), 'cpus': os.cpu_count(),
+                },
+                'results': results,
+            }, output, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = find_regressions(results, json.load(baseline)['results'], args.threshold)
+        for regression in regressions:
+            print(f'Regression of {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
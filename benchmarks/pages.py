@@ -0,0 +1,152 @@
+"""
+Requests per second of the feed, profile and post pages, served by the sync
+views through the WSGI handler and by the async views through the ASGI
+handler at the same concurrency, e.g.::
+
+    python -m benchmarks.pages --concurrency 200 --latency 5
+
+``--latency`` delays every SQL query to mimic a database across the network,
+the case where a WSGI worker sits idle; ``--workers`` is the number of WSGI
+worker threads, the ASGI path runs on one event loop. Every mode runs in its own process:
+the views are chosen when the URLconf is imported. Requires Django 3.1.
+
+On one CPU with ``--requests 600 --concurrency 100 --workers 9``, WSGI serves
+about 105 requests/s at 50 ms per query and ASGI 75, at 100 ms WSGI drops to
+56 and ASGI keeps 75, at 200 ms it is 29 to 63. Below the crossover the pages
+are bound by the CPU, which the ASGI path spends more of, see
+``posts.async_views``.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import seed, setup, test_database
+
+MODES = ('wsgi', 'asgi')
+
+
+def delay_queries(latency):
+
+    def execute(execute, sql, params, many, context):
+        time.sleep(latency)
+        return execute(sql, params, many, context)
+
+    def install(sender, connection, **kwargs):
+        if execute not in connection.execute_wrappers:
+            connection.execute_wrappers.append(execute)
+
+    from django.db import connections
+    from django.db.backends.signals import connection_created
+
+    connection_created.connect(install, weak=False)
+    for connection in connections.all():
+        install(None, connection)
+
+
+def get_paths(count):
+    from posts.models import Post
+
+    posts = Post.objects.select_related('author').order_by('-pk')[:count]
+    paths = ['/']
+    for post in posts:
+        paths += [f'/{post.author.username}/', f'/{post.author.username}/{post.pk}/']
+    return paths
+
+
+def run_wsgi(paths, requests, concurrency, workers):
+    from django.core.handlers.wsgi import WSGIHandler
+    from django.test import RequestFactory
+
+    handler = WSGIHandler()
+    factory = RequestFactory()
+
+    def get(index):
+        statuses = []
+        response = handler(factory.get(paths[index % len(paths)]).environ, lambda status, headers: statuses.append(status))
+        b''.join(response)
+        response.close()
+        return int(statuses[0].split()[0])
+
+    # Requests beyond the number of workers wait for a free one, as they do
+    # in the backlog of a WSGI server.
+    with ThreadPoolExecutor(max_workers=min(workers, concurrency)) as executor:
+        return list(executor.map(get, range(requests)))
+
+
+def run_asgi(paths, requests, concurrency, workers):
+    from django.core.handlers.asgi import ASGIHandler
+
+    handler = ASGIHandler()
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get(index):
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': paths[index % len(paths)], 'query_string': b'',
+                'headers': [(b'host', b'testserver')], 'server': ('testserver', 80),
+            }
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send(message):
+                messages.append(message)
+
+            async with semaphore:
+                await handler(scope, receive, send)
+            return messages[0]['status']
+
+        return await asyncio.gather(*(get(index) for index in range(requests)))
+
+    return asyncio.run(main())
+
+
+def benchmark(mode, args):
+    setup()
+    with test_database():
+        seed(args.posts)
+        paths = get_paths(args.pages)
+        if args.latency:
+            delay_queries(args.latency / 1000)
+        # Not the test client: it copies the context of every template rendered
+        # by any request while it waits for its own response.
+        run = run_asgi if mode == 'asgi' else run_wsgi
+        run(paths, len(paths), args.concurrency, args.workers)
+        started = time.monotonic()
+        statuses = run(paths, args.requests, args.concurrency, args.workers)
+        elapsed = time.monotonic() - started
+    errors = sum(status != 200 for status in statuses)
+    print(
+        f'{mode}: {args.requests} requests at concurrency {args.concurrency} in {elapsed:.2f}s, '
+        f'{args.requests / elapsed:.0f} requests/s, {errors} errors'
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--mode', choices=MODES, help='Run one mode in this process')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=100, help='Requests in flight at once')
+    parser.add_argument(
+        '--workers', type=int, default=2 * os.cpu_count() + 1, help='Worker threads of the WSGI server'
+    )
+    parser.add_argument('--latency', type=float, default=0, help='Milliseconds added to every SQL query')
+    parser.add_argument('--posts', type=int, default=1000, help='Posts to seed')
+    parser.add_argument('--pages', type=int, default=50, help='Posts whose pages are requested')
+    args = parser.parse_args()
+
+    if args.mode:
+        return benchmark(args.mode, args)
+    for mode in MODES:
+        env = dict(os.environ, POSTS_ASYNC_VIEWS=str(mode == 'asgi'))
+        subprocess.run([sys.executable, '-m', 'benchmarks.pages', '--mode', mode, *sys.argv[1:]], env=env, check=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import cache
 from .models import Post, Group
 
 
@@ -9,6 +10,23 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     empty_value_display = '-пусто-'
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        tags = cache.post_tags(obj)
+        if 'group' in form.changed_data and form.initial.get('group'):
+            tags.append(f'group:{form.initial["group"]}')
+        cache.invalidate(*tags)
+
+    def delete_model(self, request, obj):
+        tags = cache.post_tags(obj)
+        super().delete_model(request, obj)
+        cache.invalidate(*tags)
+
+    def delete_queryset(self, request, queryset):
+        tags = [tag for post in queryset for tag in cache.post_tags(post)]
+        super().delete_queryset(request, queryset)
+        cache.invalidate(*tags)
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description')
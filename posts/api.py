@@ -0,0 +1,199 @@
+"""
+Read-only JSON API.
+
+Lists are paginated with ``?after=``/``?before=`` cursors. ``?fields=`` limits
+the post fields that are both selected and serialized, authors and groups of
+a whole page are fetched with one query each.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.paginator import InvalidPage
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.views.generic import View
+
+from . import timelines
+from .mixins import AuthorMixin, GroupMixin
+from .models import Post, Group, Comment
+from .paginators import CursorPaginator
+from .summary import get_summary
+
+User = get_user_model()
+
+# Serialized post fields and the columns they are read from.
+POST_FIELDS = {
+    'id': ['id'],
+    'text': ['text'],
+    'pub_date': ['pub_date'],
+    'author': ['author'],
+    'group': ['group'],
+    'image': ['image'],
+    'comments_count': ['comments_count'],
+}
+# Columns every page needs for its cursors.
+CURSOR_COLUMNS = ['id', 'pub_date']
+
+
+class ApiError(Exception):
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_fields(request):
+    if not request.GET.get('fields'):
+        return list(POST_FIELDS)
+    fields = [field for field in request.GET['fields'].split(',') if field]
+    unknown = sorted(set(fields) - set(POST_FIELDS))
+    if unknown:
+        raise ApiError(f'Unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def post_columns(fields):
+    columns = list(CURSOR_COLUMNS)
+    for field in fields:
+        columns += [column for column in POST_FIELDS[field] if column not in columns]
+    return columns
+
+
+def get_users(ids):
+    return User.objects.only('username', 'first_name', 'last_name').in_bulk(set(ids))
+
+
+def get_groups(ids):
+    return Group.objects.only('slug', 'title').in_bulk(set(ids) - {None})
+
+
+def serialize_user(user):
+    return {'username': user.username, 'name': user.get_full_name()}
+
+
+def serialize_group(group):
+    return {'slug': group.slug, 'title': group.title}
+
+
+def serialize_post(post, fields, users, groups):
+    data = {}
+    for field in fields:
+        if field == 'author':
+            data[field] = serialize_user(users[post.author_id])
+        elif field == 'group':
+            data[field] = serialize_group(groups[post.group_id]) if post.group_id else None
+        elif field == 'image':
+            data[field] = post.image.url if post.image else None
+        else:
+            data[field] = getattr(post, field)
+    return data
+
+
+def serialize_posts(posts, fields):
+    users = get_users(post.author_id for post in posts) if 'author' in fields else {}
+    groups = get_groups(post.group_id for post in posts) if 'group' in fields else {}
+    return [serialize_post(post, fields, users, groups) for post in posts]
+
+
+def serialize_comment(comment, users):
+    return {
+        'id': comment.pk,
+        'text': comment.text,
+        'created': comment.created,
+        'author': serialize_user(users[comment.author_id]),
+    }
+
+
+class ApiView(View):
+    http_method_names = ['get', 'head', 'options']
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        except Http404:
+            return self.render_json({'error': 'Not found'}, status=404)
+        except InvalidPage as e:
+            return self.render_json({'error': str(e)}, status=400)
+        except ApiError as e:
+            return self.render_json({'error': str(e)}, status=e.status)
+
+    def render_json(self, data, status=200):
+        return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+
+    def page_url(self, **params):
+        query = self.request.GET.copy()
+        for key, value in params.items():
+            query.pop(key, None)
+            if value is not None:
+                query[key] = value
+        return self.request.build_absolute_uri(f'{self.request.path}?{query.urlencode()}')
+
+    def paginate(self, queryset, ordering=('-pub_date', '-pk')):
+        paginator = CursorPaginator(queryset, settings.POSTS_API_PAGE_SIZE, ordering=ordering)
+        page = paginator.page(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        links = {
+            'next': self.page_url(after=page.next_cursor, before=None) if page.has_next() else None,
+            'previous': self.page_url(before=page.previous_cursor, after=None) if page.has_previous() else None,
+        }
+        return page, links
+
+
+class PostListApiView(ApiView):
+
+    def get_queryset(self):
+        return Post.objects.all()
+
+    def get(self, request, *args, **kwargs):
+        fields = parse_fields(request)
+        page, links = self.paginate(self.get_queryset().only(*post_columns(fields)))
+        return self.render_json({'results': serialize_posts(list(page), fields), **links})
+
+
+class GroupPostsApiView(GroupMixin, PostListApiView):
+
+    def get_queryset(self):
+        return Post.objects.filter(group=self.group)
+
+
+class UserPostsApiView(AuthorMixin, PostListApiView):
+
+    def get_queryset(self):
+        return Post.objects.filter(author=self.author)
+
+
+class FollowPostsApiView(PostListApiView):
+
+    def get_queryset(self):
+        if not self.request.user.is_authenticated:
+            raise ApiError('Authentication required', status=401)
+        return timelines.timeline_queryset(self.request.user.pk)
+
+
+class PostApiView(ApiView):
+    """The post with a page of its comments, oldest first."""
+
+    def get(self, request, *args, **kwargs):
+        fields = parse_fields(request)
+        post = get_object_or_404(Post.objects.only(*post_columns(fields)), pk=kwargs['post_id'])
+        comments = Comment.objects.filter(post_id=post.pk).only('text', 'created', 'author', 'post')
+        page, links = self.paginate(comments, ordering=('created', 'pk'))
+        authors = [post.author_id] if 'author' in fields else []
+        users = get_users(authors + [comment.author_id for comment in page])
+        groups = get_groups([post.group_id]) if 'group' in fields else {}
+        return self.render_json({
+            'post': serialize_post(post, fields, users, groups),
+            'comments': [serialize_comment(comment, users) for comment in page],
+            **links,
+        })
+
+
+class UserApiView(AuthorMixin, ApiView):
+
+    def get(self, request, *args, **kwargs):
+        summary = get_summary(self.author, request.user)
+        return self.render_json({
+            **serialize_user(self.author),
+            'posts_count': summary.posts_count,
+            'followers_count': summary.followers_count,
+            'following_count': summary.following_count,
+            'is_following': summary.is_following,
+        })
@@ -0,0 +1,12 @@
+from django.urls import path
+
+from . import api
+
+urlpatterns = [
+    path('posts/', api.PostListApiView.as_view(), name='api_posts'),
+    path('posts/<int:post_id>/', api.PostApiView.as_view(), name='api_post'),
+    path('follow/posts/', api.FollowPostsApiView.as_view(), name='api_follow_posts'),
+    path('groups/<slug>/posts/', api.GroupPostsApiView.as_view(), name='api_group_posts'),
+    path('users/<username>/', api.UserApiView.as_view(), name='api_user'),
+    path('users/<username>/posts/', api.UserPostsApiView.as_view(), name='api_user_posts'),
+]
@@ -0,0 +1,78 @@
+"""
+Async variants of the read-heavy pages for the ASGI deployment.
+
+A page view runs as a coroutine: the ETag check runs first, then the
+independent lookups of the page (the feed, the author summary, the comments)
+are issued concurrently with ``asyncio.gather()`` and the page is rendered from
+their memoized results. Every step runs in a pool of worker threads with
+database connections of their own: Django runs the sync code of all requests
+of an ASGI worker in one thread, where a slow query would block every other
+request. Requires Django 3.1 or later, enabled by ``POSTS_ASYNC_VIEWS``.
+
+The views pay off when the requests of a worker mostly wait for the database.
+Under ASGI, Django 3.2 runs every hook of its own middleware in that one sync
+thread, about twenty thread hops a request, so a request costs more CPU than
+under WSGI. With a warm cache and a fast database the pages are bound by the
+CPU and WSGI serves more of them; see ``benchmarks.pages`` for the crossover.
+"""
+import asyncio
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    # Not the default executor of the loop: its size follows the CPU count,
+    # while the lookups mostly wait for the database.
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.POSTS_ASYNC_LOOKUP_THREADS, thread_name_prefix='lookups')
+        return _executor
+
+
+def run_in_thread(function):
+    """Runs ``function`` in a worker thread, its database connection is closed as after a request."""
+
+    def run():
+        try:
+            return function()
+        finally:
+            close_old_connections()
+
+    context = contextvars.copy_context()
+    return asyncio.get_running_loop().run_in_executor(get_executor(), context.run, run)
+
+
+def render(view, request, *args, **kwargs):
+    response = view.dispatch(request, *args, **kwargs)
+    if hasattr(response, 'render') and callable(response.render):
+        response.render()
+    return response
+
+
+def as_async_view(view_class, **initkwargs):
+    """Coroutine view for ``view_class``, a page view built on ``ParallelLookupsMixin``."""
+
+    async def view(request, *args, **kwargs):
+        self = view_class(**initkwargs)
+        self.setup(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            # Resolves the viewer, the author and the versions of the cache tags
+            # the lookups depend on.
+            response = await run_in_thread(self.get_not_modified_response)
+            if response is not None:
+                return response
+            await asyncio.gather(*(run_in_thread(lookup) for lookup in self.get_parallel_lookups()))
+        return await run_in_thread(partial(render, self, request, *args, **kwargs))
+
+    view.view_class = view_class
+    view.view_initkwargs = initkwargs
+    return view
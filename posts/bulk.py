@@ -0,0 +1,473 @@
+"""
+Row formats of the bulk export and import commands.
+
+Rows reference users by username, groups by slug and posts by id, so that a
+dump can be loaded into another database. Every dataset is read and written
+row by row, as NDJSON or CSV, optionally gzipped.
+
+The import inserts rows in chunks with ``bulk_create()``, which sends no
+signals: what the signals maintain (counters, timelines, the search index,
+cache tags) is brought up to date for every chunk instead. Loaded rows get
+new local ids, see ``Importer``.
+"""
+import contextlib
+import csv
+import datetime
+import gzip
+import io
+import json
+import sys
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection
+from django.db.models import Max
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from . import counters, search, timelines
+from .cache import invalidate, post_tags
+from .models import Post, Group, Comment, Follow, ImportedId
+from .paginators import COUNTS_TAG
+
+User = get_user_model()
+
+
+class Dataset(object):
+    """Exported columns of a model and the lookups the export filters on."""
+
+    def __init__(self, model, columns, date_field, author_lookup, group_lookup=None):
+        self.model = model
+        self.columns = columns
+        self.date_field = date_field
+        self.author_lookup = author_lookup
+        self.group_lookup = group_lookup
+
+    def queryset(self, since=None, until=None, group=None, author=None):
+        queryset = self.model.objects.order_by('pk')
+        if since:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': since})
+        if until:
+            queryset = queryset.filter(**{f'{self.date_field}__lt': until})
+        if group:
+            queryset = queryset.filter(**{self.group_lookup: group})
+        if author:
+            queryset = queryset.filter(**{self.author_lookup: author})
+        return queryset
+
+    def rows(self, queryset, chunk_size):
+        names = list(self.columns)
+        for values in queryset.values_list(*self.columns.values()).iterator(chunk_size=chunk_size):
+            yield dict(zip(names, values))
+
+
+DATASETS = {
+    'posts': Dataset(
+        Post,
+        {
+            'id': 'id', 'author': 'author__username', 'group': 'group__slug', 'text': 'text',
+            'pub_date': 'pub_date', 'image': 'image',
+        },
+        date_field='pub_date', author_lookup='author__username', group_lookup='group__slug',
+    ),
+    'comments': Dataset(
+        Comment,
+        {'id': 'id', 'post': 'post_id', 'author': 'author__username', 'text': 'text', 'created': 'created'},
+        date_field='created', author_lookup='author__username', group_lookup='post__group__slug',
+    ),
+    'follows': Dataset(
+        Follow,
+        {'user': 'user__username', 'author': 'author__username', 'follow_on_date': 'follow_on_date'},
+        date_field='follow_on_date', author_lookup='author__username',
+    ),
+}
+
+FORMATS = ('ndjson', 'csv')
+
+
+@contextlib.contextmanager
+def open_output(path, compress):
+    """Text stream writing to ``path`` (``-`` is stdout), gzipped with ``compress``."""
+    binary = sys.stdout.buffer if path == '-' else open(path, 'wb')
+    compressed = gzip.GzipFile(fileobj=binary, mode='wb') if compress else None
+    stream = io.TextIOWrapper(compressed or binary, encoding='utf-8', newline='')
+    try:
+        yield stream
+    finally:
+        stream.flush()
+        # Detached, so that closing the wrapper never closes stdout.
+        stream.detach()
+        if compressed:
+            compressed.close()
+        if path == '-':
+            binary.flush()
+        else:
+            binary.close()
+
+
+class ExportEncoder(DjangoJSONEncoder):
+
+    def default(self, o):
+        # Full precision, DjangoJSONEncoder truncates to milliseconds.
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class NdjsonWriter(object):
+
+    def __init__(self, stream, columns):
+        self.stream = stream
+
+    def write(self, row):
+        self.stream.write(json.dumps(row, cls=ExportEncoder, ensure_ascii=False))
+        self.stream.write('\n')
+
+
+class CsvWriter(object):
+
+    def __init__(self, stream, columns):
+        self.writer = csv.DictWriter(stream, list(columns))
+        self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow({key: '' if value is None else value for key, value in row.items()})
+
+
+WRITERS = {
+    'ndjson': NdjsonWriter,
+    'csv': CsvWriter,
+}
+
+
+@contextlib.contextmanager
+def open_input(path):
+    """Text stream reading ``path`` (``-`` is stdin), gzip is detected by its magic number."""
+    binary = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    buffered = io.BufferedReader(binary) if not hasattr(binary, 'peek') else binary
+    compressed = gzip.GzipFile(fileobj=buffered, mode='rb') if buffered.peek(2)[:2] == b'\x1f\x8b' else None
+    stream = io.TextIOWrapper(compressed or buffered, encoding='utf-8', newline='')
+    try:
+        yield stream
+    finally:
+        stream.detach()
+        if path != '-':
+            binary.close()
+
+
+def read_ndjson(stream):
+    for line in stream:
+        if line.strip():
+            yield json.loads(line)
+
+
+def read_csv(stream):
+    for row in csv.DictReader(stream):
+        yield {key: value if value != '' else None for key, value in row.items()}
+
+
+READERS = {
+    'ndjson': read_ndjson,
+    'csv': read_csv,
+}
+
+
+def chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_moment(value, default=None):
+    """Aware datetime of an ISO 8601 date and time or date, ``default`` if it is empty or invalid."""
+    if isinstance(value, datetime.datetime):
+        return value
+    try:
+        moment = parse_datetime(value) if value else None
+        if moment is None and value:
+            date = parse_date(value)
+            moment = datetime.datetime.combine(date, datetime.time()) if date else None
+    except ValueError:
+        moment = None
+    if moment is None:
+        return default
+    return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
+
+
+def allocate_ids(model, count):
+    """
+    ``count`` new primary keys of ``model``. PostgreSQL hands them out from the
+    sequence of the table, the site may keep writing during the import.
+    Elsewhere they follow the largest id: import with the site offline, a row
+    saved meanwhile makes the chunk fail with an ``IntegrityError``.
+    """
+    if not count:
+        return []
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                [model._meta.db_table, model._meta.pk.column, count],
+            )
+            return [pk for pk, in cursor.fetchall()]
+    last = model.objects.aggregate(last=Max('pk'))['last'] or 0
+    return list(range(last + 1, last + 1 + count))
+
+
+@contextlib.contextmanager
+def keep_dates(model, field_name):
+    """
+    Lets ``bulk_create()`` save the given dates instead of ``auto_now_add``
+    ones. The field is shared by the process, the import runs in a command of
+    its own.
+    """
+    field = model._meta.get_field(field_name)
+    auto_now_add = field.auto_now_add
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = auto_now_add
+
+
+class LookupCache(object):
+    """
+    Values of ``value`` by natural key. Keys missing from the cache are fetched
+    in one query per batch; the cache is dropped when it outgrows ``limit``.
+    """
+    batch_size = 500
+
+    def __init__(self, queryset, field, value='pk', limit=100000):
+        self.queryset = queryset
+        self.field = field
+        self.value = value
+        self.limit = limit
+        self.pks = {}
+
+    def missing(self, keys):
+        return {key for key in keys if key is not None and key not in self.pks}
+
+    def resolve(self, keys):
+        missing = list(self.missing(keys))
+        if len(self.pks) + len(missing) > self.limit:
+            self.pks.clear()
+            missing = list(self.missing(keys))
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            self.pks.update(self.queryset.filter(**{f'{self.field}__in': batch}).values_list(self.field, self.value))
+        return self.pks
+
+
+def get_external_id(row):
+    return int(row['id']) if row.get('id') else None
+
+
+class Importer(object):
+    """
+    Loads chunks of rows of one dataset, rows with unknown references are skipped.
+
+    Rows get new local ids. The local id of a row with an ``id`` is kept in
+    ``ImportedId`` by that id and the ``source`` of the dump: the row is
+    skipped when it is loaded again, and the rows referring to it are linked
+    to its local id.
+    """
+    model = None
+    dataset = None
+    date_field = None
+
+    def __init__(self, create_missing=False, source=''):
+        self.create_missing = create_missing
+        self.source = source
+        self.users = LookupCache(User.objects.all(), 'username')
+        self.imported_ids = self.get_imported_ids(self.dataset)
+        self.imported = 0
+        self.skipped = 0
+
+    def get_imported_ids(self, dataset):
+        """Local ids of the rows of ``dataset`` loaded from ``source`` before, by their ids in the dump."""
+        return LookupCache(ImportedId.objects.filter(dataset=dataset, source=self.source), 'external_id', 'local_id')
+
+    def resolve_users(self, usernames):
+        users = self.users.resolve(usernames)
+        missing = self.users.missing(usernames)
+        if missing and self.create_missing:
+            User.objects.bulk_create(
+                (User(username=username, password=make_password(None)) for username in missing),
+                ignore_conflicts=True,
+            )
+            users = self.users.resolve(missing)
+        return users
+
+    def new_rows(self, rows):
+        """The rows not loaded before, the first of the rows repeating an id."""
+        imported = self.imported_ids.resolve({get_external_id(row) for row in rows})
+        seen = set()
+        new = []
+        for row in rows:
+            external_id = get_external_id(row)
+            if external_id is None or (external_id not in imported and external_id not in seen):
+                seen.add(external_id)
+                new.append(row)
+        return new
+
+    def build(self, rows):
+        """Model instances of the rows that can be inserted, with the ``external_id`` of their row."""
+        raise NotImplementedError
+
+    def refresh(self, objects):
+        """Updates what the signals would have for the inserted ``objects``."""
+        raise NotImplementedError
+
+    def insert(self, objects):
+        for obj, pk in zip(objects, allocate_ids(self.model, len(objects))):
+            obj.pk = pk
+        with keep_dates(self.model, self.date_field):
+            self.model.objects.bulk_create(objects)
+        mapped = [obj for obj in objects if obj.external_id is not None]
+        ImportedId.objects.bulk_create(
+            ImportedId(dataset=self.dataset, source=self.source, external_id=obj.external_id, local_id=obj.pk)
+            for obj in mapped
+        )
+        self.imported_ids.pks.update((obj.external_id, obj.pk) for obj in mapped)
+
+    def load(self, rows):
+        objects = self.build(self.new_rows(rows))
+        self.skipped += len(rows) - len(objects)
+        self.insert(objects)
+        self.refresh(objects)
+        self.imported += len(objects)
+
+    def finish(self):
+        invalidate('index', COUNTS_TAG)
+
+
+class PostImporter(Importer):
+    model = Post
+    dataset = 'posts'
+    date_field = 'pub_date'
+
+    def __init__(self, create_missing=False, source=''):
+        super().__init__(create_missing, source)
+        self.groups = LookupCache(Group.objects.all(), 'slug')
+
+    def resolve_groups(self, slugs):
+        groups = self.groups.resolve(slugs)
+        missing = self.groups.missing(slugs)
+        if missing and self.create_missing:
+            Group.objects.bulk_create(
+                (Group(slug=slug, title=slug, description='') for slug in missing), ignore_conflicts=True
+            )
+            groups = self.groups.resolve(missing)
+        return groups
+
+    def build(self, rows):
+        users = self.resolve_users({row['author'] for row in rows})
+        groups = self.resolve_groups({row.get('group') for row in rows})
+        posts = []
+        for row in rows:
+            if row['author'] not in users or (row.get('group') and row['group'] not in groups):
+                continue
+            post = Post(
+                author_id=users[row['author']], group_id=groups.get(row.get('group')), text=row['text'],
+                pub_date=parse_moment(row.get('pub_date'), timezone.now()), image=row.get('image') or None,
+            )
+            post.external_id = get_external_id(row)
+            posts.append(post)
+        return posts
+
+    def refresh(self, posts):
+        counters.add(User, 'posts_count', Counter(post.author_id for post in posts))
+        timelines.push_posts(posts)
+        search.index_new_posts(posts)
+        invalidate(*{tag for post in posts for tag in post_tags(post)})
+
+
+class CommentImporter(Importer):
+    """Comments are linked to the posts loaded from the same ``source``."""
+    model = Comment
+    dataset = 'comments'
+    date_field = 'created'
+
+    def __init__(self, create_missing=False, source=''):
+        super().__init__(create_missing, source)
+        self.posts = self.get_imported_ids('posts')
+
+    def build(self, rows):
+        users = self.resolve_users({row['author'] for row in rows})
+        imported_posts = self.posts.resolve({int(row['post']) for row in rows if row.get('post')})
+        # The imported posts may have been deleted since.
+        posts = set(Post.objects.filter(pk__in=list(imported_posts.values())).values_list('pk', flat=True))
+        comments = []
+        for row in rows:
+            post_id = imported_posts.get(int(row['post'])) if row.get('post') else None
+            if post_id not in posts or row['author'] not in users:
+                continue
+            comment = Comment(
+                post_id=post_id, author_id=users[row['author']], text=row['text'],
+                created=parse_moment(row.get('created'), timezone.now()),
+            )
+            comment.external_id = get_external_id(row)
+            comments.append(comment)
+        return comments
+
+    def refresh(self, comments):
+        counters.add(Post, 'comments_count', Counter(comment.post_id for comment in comments))
+        posts = Post.objects.filter(pk__in={comment.post_id for comment in comments})
+        # Comment counters are shown on the post cards of every feed.
+        invalidate(*{tag for post in posts.only('author', 'group') for tag in post_tags(post)})
+
+
+class FollowImporter(Importer):
+    """Follows have no ids, a follow already in the database is skipped."""
+    model = Follow
+    dataset = 'follows'
+    date_field = 'follow_on_date'
+
+    def new_rows(self, rows):
+        return rows
+
+    def build(self, rows):
+        users = self.resolve_users({row['user'] for row in rows} | {row['author'] for row in rows})
+        pairs = {
+            (users[row['user']], users[row['author']]) for row in rows
+            if row['user'] in users and row['author'] in users and row['user'] != row['author']
+        }
+        existing = set()
+        if pairs:
+            existing = set(Follow.objects.filter(
+                user_id__in={user_id for user_id, _ in pairs}, author_id__in={author_id for _, author_id in pairs}
+            ).values_list('user', 'author'))
+        follows = []
+        for row in rows:
+            pair = (users.get(row['user']), users.get(row['author']))
+            if pair not in pairs or pair in existing:
+                continue
+            existing.add(pair)
+            follow = Follow(
+                user_id=pair[0], author_id=pair[1],
+                follow_on_date=parse_moment(row.get('follow_on_date'), timezone.now()),
+            )
+            follow.external_id = None
+            follows.append(follow)
+        return follows
+
+    def refresh(self, follows):
+        counters.add(User, 'followers_count', Counter(follow.author_id for follow in follows))
+        counters.add(User, 'following_count', Counter(follow.user_id for follow in follows))
+        user_ids = {follow.user_id for follow in follows} | {follow.author_id for follow in follows}
+        timelines.backfill_follows(follows)
+        invalidate(*{f'author:{user_id}' for user_id in user_ids})
+
+
+IMPORTERS = {
+    'posts': PostImporter,
+    'comments': CommentImporter,
+    'follows': FollowImporter,
+}
@@ -0,0 +1,81 @@
+"""
+Tag-versioned cache.
+
+Every tag (``index``, ``author:<id>``, ``group:<id>``, ``post:<id>``) has a
+version stored in the cache, and the key of a cached entry embeds the versions
+of the tags it depends on. Invalidating a tag only bumps its version: stale
+entries are never read again and expire on their own.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import routers
+
+
+def _tag_key(tag):
+    return f'tag:{tag}'
+
+
+def _initial_version():
+    # Microseconds since the epoch: a version recreated after eviction never
+    # collides with one that was incremented before.
+    return int(time.time() * 10 ** 6)
+
+
+def post_tags(post):
+    tags = ['index', f'post:{post.pk}', f'author:{post.author_id}']
+    if post.group_id:
+        tags.append(f'group:{post.group_id}')
+    return tags
+
+
+def get_version(*tags):
+    """Combined version of ``tags``, changes whenever one of them is invalidated."""
+    keys = [_tag_key(tag) for tag in tags]
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    if missing:
+        for key in missing:
+            cache.add(key, _initial_version(), None)
+        versions.update(cache.get_many(missing))
+    return '.'.join(str(versions.get(key, 0)) for key in keys)
+
+
+def make_key(name, tags, *vary):
+    # The entries filled from a replica are its own, see get_timeout().
+    parts = [get_version(*tags), routers.get_read_database() or '', *map(str, vary)]
+    digest = hashlib.md5(':'.join(parts).encode()).hexdigest()
+    return f'{name}:{digest}'
+
+
+def get_timeout(timeout=None):
+    """
+    Timeout of an entry filled by the current request. A replica may not have
+    the writes the tag versions already cover, so what is read from it is only
+    kept for ``POSTS_REPLICA_CACHE_TIMEOUT``.
+    """
+    timeout = timeout or settings.POSTS_CACHE_TIMEOUT
+    if routers.get_read_database() is not None:
+        return min(timeout, settings.POSTS_REPLICA_CACHE_TIMEOUT)
+    return timeout
+
+
+def get_or_set(name, tags, default, timeout=None, vary=()):
+    """Cached value of ``default()`` that is dropped when one of ``tags`` is invalidated."""
+    key = make_key(name, tags, *vary)
+    value = cache.get(key)
+    if value is None:
+        value = default()
+        cache.set(key, value, get_timeout(timeout))
+    return value
+
+
+def invalidate(*tags):
+    for tag in set(tags):
+        try:
+            cache.incr(_tag_key(tag))
+        except ValueError:
+            cache.set(_tag_key(tag), _initial_version(), None)
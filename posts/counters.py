@@ -0,0 +1,48 @@
+"""
+Denormalized counters on ``User`` and ``Post``.
+
+They are changed with ``F()`` expressions in the database, so concurrent
+writes never lose an update; ``manage.py recount`` repairs any drift.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Post, Comment, Follow
+
+User = get_user_model()
+
+
+def change(model, pk, field, delta):
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def add(model, field, deltas):
+    """Adds ``deltas`` by primary key to ``field``, one query per distinct delta."""
+    pks = defaultdict(list)
+    for pk, delta in deltas.items():
+        pks[delta].append(pk)
+    for delta, batch in pks.items():
+        model.objects.filter(pk__in=batch).update(**{field: F(field) + delta})
+
+
+def _count(model, field):
+    counts = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk'))
+    return Coalesce(Subquery(counts.values('count'), output_field=IntegerField()), 0)
+
+
+def recount_users(queryset):
+    return queryset.update(
+        posts_count=_count(Post, 'author'),
+        followers_count=_count(Follow, 'author'),
+        following_count=_count(Follow, 'user'),
+    )
+
+
+def recount_posts(queryset):
+    return queryset.update(comments_count=_count(Comment, 'post'))
@@ -0,0 +1,109 @@
+"""
+New posts of the open feed pages.
+
+Every published post appends a ``FeedEvent`` row after commit: the table is
+the broker all workers share. Under ASGI, ``posts.streams`` pushes the new
+posts to the first page of a feed as Server-Sent Events, and a reconnecting
+``EventSource`` resumes from ``Last-Event-ID``. Elsewhere a stream would hold
+a worker for as long as the page is open, so the page polls
+``count_new_posts()`` instead and offers to reload.
+"""
+import datetime
+import json
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Post, Group, Follow, FeedEvent
+
+Event = namedtuple('Event', ['id', 'post_id', 'author_id', 'group_id'])
+
+# Events read at once, a stream catches up in several reads.
+READ_LIMIT = 100
+# New posts counted for a polling page at most.
+NEW_POSTS_LIMIT = 100
+# The scope key EventStreamApp marks the requests it passes on with.
+STREAMS_SCOPE_KEY = 'yatube.event_streams'
+
+
+def publish(post):
+    FeedEvent.objects.create(post=post)
+    retention = datetime.timedelta(seconds=settings.POSTS_EVENTS_RETENTION)
+    FeedEvent.objects.filter(created__lt=timezone.now() - retention).delete()
+
+
+def last_event_id():
+    return FeedEvent.objects.order_by('-pk').values_list('pk', flat=True).first() or 0
+
+
+def read_events(after):
+    rows = (
+        FeedEvent.objects
+        .filter(pk__gt=after)
+        .order_by('pk')
+        .values_list('pk', 'post', 'post__author', 'post__group')[:READ_LIMIT]
+    )
+    return [Event(*row) for row in rows]
+
+
+def is_streamed(request):
+    """Whether the page of ``request`` can open an event stream, see ``posts.streams.EventStreamApp``."""
+    return getattr(request, 'scope', {}).get(STREAMS_SCOPE_KEY, False)
+
+
+def parse_id(value):
+    try:
+        return max(int(value), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+def get_feed_filter(feed, user, slug=None):
+    """Tells the events of ``feed`` apart, the follow feed reads the followed authors once."""
+    if feed == 'index':
+        return lambda event: True
+    if feed == 'group':
+        group_id = get_object_or_404(Group, slug=slug).pk
+        return lambda event: event.group_id == group_id
+    if not user.is_authenticated:
+        raise PermissionDenied
+    authors = set(Follow.objects.filter(user=user).values_list('author', flat=True))
+    return lambda event: event.author_id in authors
+
+
+def count_new_posts(feed, user, after, slug=None):
+    """Posts published in ``feed`` after the post ``after``, up to ``NEW_POSTS_LIMIT``."""
+    queryset = FeedEvent.objects.filter(post_id__gt=after)
+    if feed == 'group':
+        queryset = queryset.filter(post__group=get_object_or_404(Group, slug=slug))
+    elif feed == 'follow':
+        if not user.is_authenticated:
+            raise PermissionDenied
+        queryset = queryset.filter(post__author__following__user=user)
+    return queryset[:NEW_POSTS_LIMIT].count()
+
+
+def get_posts(events):
+    return Post.objects.select_related('author', 'group').in_bulk([event.post_id for event in events])
+
+
+def render_card(post, user):
+    return render_to_string('common/card.html', {'post': post, 'user': user})
+
+
+def format_event(event, html):
+    data = json.dumps({'id': event.post_id, 'html': html}, ensure_ascii=False)
+    return f'id: {event.id}\nevent: post\ndata: {data}\n\n'
+
+
+def format_retry():
+    # Reconnect soon after a worker restart.
+    return 'retry: 1000\n\n'
+
+
+def format_keepalive():
+    return ': keepalive\n\n'
@@ -0,0 +1,201 @@
+"""
+RSS and Atom feeds of the index, communities and authors.
+
+A feed is written item by item into a streaming response while the posts are
+read with an iterator. The written document is cached under the cache tags of
+the matching HTML page, and conditional GETs are answered the same way.
+"""
+import io
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template.defaultfilters import linebreaksbr
+from django.urls import reverse
+from django.utils import feedgenerator
+from django.utils.cache import patch_vary_headers
+from django.utils.text import Truncator
+from django.utils.translation import get_language, gettext as _
+from django.utils.xmlutils import SimplerXMLGenerator
+from django.views.generic import View
+
+from .cache import make_key
+from .mixins import AuthorMixin, ConditionalGetMixin, GroupMixin
+from .models import Post
+
+
+class StreamingFeedMixin(object):
+    """Feed written item by item, ``items`` are keyword arguments of ``add_item()``."""
+
+    def write_head(self, handler):
+        raise NotImplementedError
+
+    def write_tail(self, handler):
+        raise NotImplementedError
+
+    def stream(self, items, encoding='utf-8'):
+        buffer = io.StringIO()
+        handler = SimplerXMLGenerator(buffer, encoding)
+
+        def flush():
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+            return chunk
+
+        items = iter(items)
+        first = next(items, None)
+        # The newest item is added before the head is written: the head
+        # carries the date of the latest update.
+        self.items = []
+        if first is not None:
+            self.add_item(**first)
+        handler.startDocument()
+        self.write_head(handler)
+        self.write_items(handler)
+        yield flush()
+        for item in items:
+            self.items = []
+            self.add_item(**item)
+            self.write_items(handler)
+            yield flush()
+        self.write_tail(handler)
+        yield flush()
+
+
+class StreamingRssFeed(StreamingFeedMixin, feedgenerator.Rss201rev2Feed):
+
+    def write_head(self, handler):
+        handler.startElement('rss', self.rss_attributes())
+        handler.startElement('channel', self.root_attributes())
+        self.add_root_elements(handler)
+
+    def write_tail(self, handler):
+        self.endChannelElement(handler)
+        handler.endElement('rss')
+
+
+class StreamingAtomFeed(StreamingFeedMixin, feedgenerator.Atom1Feed):
+
+    def write_head(self, handler):
+        handler.startElement('feed', self.root_attributes())
+        self.add_root_elements(handler)
+
+    def write_tail(self, handler):
+        handler.endElement('feed')
+
+
+FEED_TYPES = {
+    'rss': StreamingRssFeed,
+    'atom': StreamingAtomFeed,
+}
+
+
+class FeedFormatConverter:
+    regex = '|'.join(FEED_TYPES)
+
+    def to_python(self, value):
+        return value
+
+    def to_url(self, value):
+        return value
+
+
+def _cache_chunks(key, chunks):
+    written = []
+    for chunk in chunks:
+        written.append(chunk)
+        yield chunk
+    cache.set(key, ''.join(written), settings.POSTS_CACHE_TIMEOUT)
+
+
+class PostFeedView(View):
+    """Streams the newest ``POSTS_FEED_ITEMS`` posts of ``get_queryset()``."""
+    title = ''
+    page_url_name = None
+
+    def get_queryset(self):
+        return Post.objects.order_by('-pub_date')
+
+    def get_title(self):
+        return self.title
+
+    def get_page_url(self):
+        return reverse(self.page_url_name)
+
+    def get_items(self):
+        posts = self.get_queryset().select_related('author', 'group')[:settings.POSTS_FEED_ITEMS]
+        for post in posts.iterator():
+            link = self.request.build_absolute_uri(reverse('post', args=[post.author.username, post.pk]))
+            yield {
+                'title': Truncator(post.text).words(10),
+                'link': link,
+                # Descriptions are HTML: the text is escaped like on the pages.
+                'description': linebreaksbr(post.text, autoescape=True),
+                'pubdate': post.pub_date,
+                'unique_id': link,
+                'author_name': post.author.get_full_name() or post.author.username,
+                'categories': [post.group.title] if post.group else (),
+            }
+
+    def get(self, request, *args, **kwargs):
+        feed_type = FEED_TYPES[kwargs['feed_format']]
+        # The titles and the language of the document are translated.
+        key = make_key(
+            f'feed:{kwargs["feed_format"]}', self.get_cache_tags(), request.build_absolute_uri(), get_language()
+        )
+        content = cache.get(key)
+        if content is not None:
+            response = HttpResponse(content, content_type=feed_type.content_type)
+            patch_vary_headers(response, ['Accept-Language'])
+            return response
+        feed = feed_type(
+            title=self.get_title(),
+            link=request.build_absolute_uri(self.get_page_url()),
+            description=self.get_title(),
+            language=get_language(),
+            feed_url=request.build_absolute_uri(),
+        )
+        response = StreamingHttpResponse(
+            _cache_chunks(key, feed.stream(self.get_items())), content_type=feed.content_type
+        )
+        patch_vary_headers(response, ['Accept-Language'])
+        return response
+
+
+class IndexFeedView(ConditionalGetMixin, PostFeedView):
+    cache_tags = ('index',)
+    page_url_name = 'index'
+
+    def get_title(self):
+        return _('last site updates').capitalize()
+
+
+class GroupFeedView(GroupMixin, ConditionalGetMixin, PostFeedView):
+
+    def get_cache_tags(self):
+        return [f'group:{self.group.pk}']
+
+    def get_queryset(self):
+        return Post.objects.filter(group=self.group).order_by('-pub_date')
+
+    def get_title(self):
+        return f'{_("community posts").capitalize()} {self.group.title}'
+
+    def get_page_url(self):
+        return reverse('group', args=[self.group.slug])
+
+
+class ProfileFeedView(AuthorMixin, ConditionalGetMixin, PostFeedView):
+
+    def get_cache_tags(self):
+        return [f'author:{self.author.pk}']
+
+    def get_queryset(self):
+        return Post.objects.filter(author=self.author).order_by('-pub_date')
+
+    def get_title(self):
+        return f'{_("author posts").capitalize()}: {self.author.username}'
+
+    def get_page_url(self):
+        return reverse('profile', args=[self.author.username])
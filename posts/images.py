@@ -0,0 +1,62 @@
+"""
+Normalization of uploaded post images.
+
+Images are downscaled to ``POSTS_IMAGE_MAX_SIZE``, rotated according to their
+EXIF orientation and re-encoded as progressive JPEG without any metadata.
+Images with more than ``POSTS_IMAGE_MAX_PIXELS`` pixels are rejected before
+their pixels are decoded.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.utils.translation import gettext_lazy as _
+from PIL import Image, ImageOps
+
+
+def _open(upload):
+    # Large uploads are already on disk, small ones are read from memory in
+    # place: the upload is never copied before decoding.
+    if hasattr(upload, 'temporary_file_path'):
+        return Image.open(upload.temporary_file_path())
+    upload.seek(0)
+    return Image.open(upload)
+
+
+def _flatten(image):
+    """RGB copy of ``image``, transparent areas become white."""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def normalize(upload):
+    """Re-encoded copy of the uploaded image ready to be saved to the storage."""
+    # A broken file may only fail once its pixels are decoded.
+    try:
+        image = _open(upload)
+        width, height = image.size
+        if width * height > settings.POSTS_IMAGE_MAX_PIXELS:
+            raise ValidationError(
+                _('The image is too large: %(width)s×%(height)s pixels.'),
+                code='image_too_large', params={'width': width, 'height': height},
+            )
+        # JPEG images are decoded straight at a reduced scale.
+        image.draft('RGB', settings.POSTS_IMAGE_MAX_SIZE)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(settings.POSTS_IMAGE_MAX_SIZE, Image.LANCZOS)
+        content = tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+        # Only the pixels are saved, EXIF and other metadata are dropped.
+        _flatten(image).save(
+            content, 'JPEG', quality=settings.POSTS_IMAGE_QUALITY, optimize=True, progressive=True
+        )
+    except (OSError, Image.DecompressionBombError):
+        raise ValidationError(_('Upload a valid image.'), code='invalid_image')
+    content.seek(0)
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return File(content, name=f'{name}.jpg')
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.bulk import DATASETS, FORMATS, WRITERS, open_output, parse_moment
+
+
+def parse_date_option(value):
+    moment = parse_moment(value)
+    if moment is None:
+        raise CommandError(f'Invalid date: {value}')
+    return moment
+
+
+class Command(BaseCommand):
+    help = 'Streams posts, comments or follows as NDJSON or CSV with constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(DATASETS))
+        parser.add_argument('--format', choices=FORMATS, default='ndjson')
+        parser.add_argument('--output', default='-', help='Output file, "-" for stdout')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output, implied by a .gz output file')
+        parser.add_argument('--since', type=parse_date_option, help='Rows created on or after this date')
+        parser.add_argument('--until', type=parse_date_option, help='Rows created before this date')
+        parser.add_argument('--group', help='Slug of the community, not supported for follows')
+        parser.add_argument('--author', help='Username of the author')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows fetched from the database at once')
+
+    def handle(self, *args, **options):
+        dataset = DATASETS[options['dataset']]
+        if options['group'] and not dataset.group_lookup:
+            raise CommandError(f'{options["dataset"]} can not be filtered by community')
+        queryset = dataset.queryset(options['since'], options['until'], options['group'], options['author'])
+        compress = options['gzip'] or options['output'].endswith('.gz')
+
+        started = time.monotonic()
+        exported = 0
+        with open_output(options['output'], compress) as stream:
+            writer = WRITERS[options['format']](stream, dataset.columns)
+            for row in dataset.rows(queryset, options['chunk_size']):
+                writer.write(row)
+                exported += 1
+        elapsed = time.monotonic() - started
+        # Reported on stderr, stdout may carry the rows.
+        self.stderr.write(self.style.SUCCESS(
+            f'Exported {exported} {options["dataset"]} in {elapsed:.1f}s ({exported / max(elapsed, 1e-6):.0f} rows/s)'
+        ))
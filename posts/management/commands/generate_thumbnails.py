@@ -0,0 +1,39 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from posts import thumbnails
+from posts.models import Post
+
+
+def generate(name):
+    """Runs in a worker process, returns the error instead of raising it."""
+    try:
+        thumbnails.generate(name, Post._meta.get_field('image').storage)
+    except Exception as e:
+        return f'{name}: {e}'
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Generates the missing thumbnails of existing post images in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help='Worker processes')
+        parser.add_argument('--chunk-size', type=int, default=20, help='Images handed to a worker at once')
+
+    def handle(self, *args, **options):
+        names = list(Post.objects.exclude(image='').order_by('image').values_list('image', flat=True).distinct())
+        # Worker processes must not share the connection of the parent.
+        connections.close_all()
+        failed = 0
+        with ProcessPoolExecutor(options['workers'], initializer=django.setup) as executor:
+            for error in executor.map(generate, names, chunksize=options['chunk_size']):
+                if error:
+                    failed += 1
+                    self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(f'Generated thumbnails of {len(names) - failed} images'))
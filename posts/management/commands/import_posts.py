@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.bulk import FORMATS, IMPORTERS, READERS, chunks, open_input
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads posts, comments or follows written by export_posts in chunked transactions. '
+        'Except on PostgreSQL, run it with the site offline: the new ids follow the largest one'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(IMPORTERS))
+        parser.add_argument('--format', choices=FORMATS, help='Input format, guessed from the file name by default')
+        parser.add_argument('--input', default='-', help='Input file, "-" for stdin, gzip is detected')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows inserted in one transaction')
+        parser.add_argument(
+            '--create-missing', action='store_true',
+            help='Create unknown users and communities instead of skipping their rows',
+        )
+        parser.add_argument(
+            '--source', default='',
+            help='Name of the database the dump comes from, rows are recognized by their ids per source',
+        )
+
+    def get_format(self, options):
+        if options['format']:
+            return options['format']
+        return 'csv' if '.csv' in options['input'] else 'ndjson'
+
+    def handle(self, *args, **options):
+        importer = IMPORTERS[options['dataset']](create_missing=options['create_missing'], source=options['source'])
+        reader = READERS[self.get_format(options)]
+
+        started = time.monotonic()
+        with open_input(options['input']) as stream:
+            for chunk in chunks(reader(stream), options['chunk_size']):
+                with transaction.atomic():
+                    importer.load(chunk)
+        importer.finish()
+        elapsed = time.monotonic() - started
+        rows = importer.imported + importer.skipped
+        self.stderr.write(self.style.SUCCESS(
+            f'Imported {importer.imported} {options["dataset"]}, skipped {importer.skipped} '
+            f'in {elapsed:.1f}s ({rows / max(elapsed, 1e-6):.0f} rows/s)'
+        ))
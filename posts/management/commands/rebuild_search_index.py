@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of posts, e.g. after changing the tokenization'
+
+    def handle(self, *args, **options):
+        indexed = 0
+        for post in Post.objects.order_by('pk').only('pk', 'text').iterator():
+            with transaction.atomic():
+                search.index_post(post)
+            indexed += 1
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts'))
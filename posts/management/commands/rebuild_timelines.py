@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import timelines
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuilds materialized follow timelines, e.g. after changing TIMELINE_FANOUT_THRESHOLD. '
+        'Run it with --switch-only periodically to push the authors back under TIMELINE_PUSH_THRESHOLD'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Rebuild only the timelines of these users')
+        parser.add_argument(
+            '--switch-only', action='store_true',
+            help='Only push the history of the authors back under TIMELINE_PUSH_THRESHOLD',
+        )
+
+    def handle(self, *args, **options):
+        timelines.switch_to_pull(User.objects.values('pk'))
+        switched = timelines.switch_to_push()
+        self.stdout.write(self.style.SUCCESS(f'Switched {switched} authors back to push'))
+        if options['switch_only']:
+            return
+        users = User.objects.order_by('pk')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        rebuilt = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            with transaction.atomic():
+                timelines.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} timelines'))
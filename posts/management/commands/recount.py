@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts import counters
+from posts.models import Post
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Recomputes denormalized post, follower, following and comment counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows updated per query')
+
+    def recount(self, model, recount, chunk_size):
+        updated = 0
+        last_pk = 0
+        while True:
+            pks = list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                return updated
+            updated += recount(model.objects.filter(pk__in=pks))
+            last_pk = pks[-1]
+
+    def handle(self, *args, **options):
+        users = self.recount(User, counters.recount_users, options['chunk_size'])
+        posts = self.recount(Post, counters.recount_posts, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Recounted {users} users and {posts} posts'))
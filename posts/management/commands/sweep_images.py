@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import storage
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Deletes the post images no post references any more, with their thumbnails. Run it periodically'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace', type=int, default=settings.POSTS_IMAGE_SWEEP_GRACE,
+            help='Keep the files stored or reused within this many seconds',
+        )
+
+    def handle(self, *args, **options):
+        field = Post._meta.get_field('image')
+        deleted = storage.sweep(field.storage, field.upload_to.rstrip('/'), options['grace'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {len(deleted)} images'))
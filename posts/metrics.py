@@ -0,0 +1,198 @@
+"""
+Request metrics of all the worker processes, in the Prometheus text format.
+
+Every process adds its counters to a file of its own in ``POSTS_METRICS_DIR``,
+mapped to memory: recording a request writes a few floats in place. The
+metrics endpoint sums the files of all processes, the files of stopped
+processes included, so counters never go back. Empty the directory when the
+server is restarted.
+"""
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, math.inf)
+
+# Name: (type, help, buckets).
+METRICS = {
+    'yatube_requests_total': ('counter', 'Requests by URL name and status.', None),
+    'yatube_request_duration_seconds': ('histogram', 'Request latency by URL name and status.', LATENCY_BUCKETS),
+    'yatube_request_queries': ('histogram', 'SQL queries per request by URL name and status.', QUERY_BUCKETS),
+}
+
+_INITIAL_SIZE = 1 << 16
+
+
+class MmapedValues(object):
+    """
+    Floats by key in a file mapped to memory, written by one process.
+
+    The file starts with the number of bytes used, followed by entries of the
+    key length, the key padded to 8 bytes and the value.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size == 0:
+            self._file.truncate(_INITIAL_SIZE)
+        self._capacity = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._used = struct.unpack_from('i', self._mmap, 0)[0] or 8
+        self._positions = {key: position for key, _, position in read_entries(self._mmap, self._used)}
+        self._lock = threading.Lock()
+
+    def add(self, key, amount):
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._append(key)
+            value, = struct.unpack_from('d', self._mmap, position)
+            struct.pack_into('d', self._mmap, position, value + amount)
+
+    def _append(self, key):
+        encoded = key.encode()
+        padded = encoded + b' ' * (8 - (len(encoded) + 4) % 8)
+        entry = struct.pack(f'i{len(padded)}sd', len(padded), padded, 0.0)
+        if self._used + len(entry) > self._capacity:
+            while self._used + len(entry) > self._capacity:
+                self._capacity *= 2
+            self._file.truncate(self._capacity)
+            self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), self._capacity)
+        self._mmap[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        # Readers see the entry once the used size covers it.
+        struct.pack_into('i', self._mmap, 0, self._used)
+        self._positions[key] = self._used - 8
+        return self._positions[key]
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+
+def read_entries(data, used):
+    position = 8
+    while position < used:
+        length, = struct.unpack_from('i', data, position)
+        position += 4
+        key = data[position:position + length].decode().rstrip(' ')
+        position += length
+        value, = struct.unpack_from('d', data, position)
+        yield key, value, position
+        position += 8
+
+
+def read_file(path):
+    with open(path, 'rb') as file:
+        data = file.read()
+    if len(data) < 8:
+        return
+    used, = struct.unpack_from('i', data, 0)
+    for key, value, _ in read_entries(data, min(used, len(data))):
+        yield key, value
+
+
+def make_key(name, sample, labels):
+    return json.dumps([name, sample, labels], sort_keys=True)
+
+
+class Registry(object):
+    """The metrics of this process, see ``record_request()``."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.pid = os.getpid()
+        self.values = MmapedValues(os.path.join(directory, f'{os.getpid()}.db'))
+
+    def inc(self, name, labels, amount=1):
+        self.values.add(make_key(name, name, labels), amount)
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][2]
+        bound = next(bound for bound in buckets if value <= bound)
+        self.values.add(make_key(name, f'{name}_bucket', dict(labels, le=format_bound(bound))), 1)
+        self.values.add(make_key(name, f'{name}_sum', labels), value)
+        self.values.add(make_key(name, f'{name}_count', labels), 1)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry():
+    # A forked worker writes a file of its own.
+    global _registry
+    with _registry_lock:
+        if _registry is None or (_registry.directory, _registry.pid) != (settings.POSTS_METRICS_DIR, os.getpid()):
+            _registry = Registry(settings.POSTS_METRICS_DIR)
+        return _registry
+
+
+def record_request(view, status, duration, queries):
+    registry = get_registry()
+    labels = {'view': view, 'status': str(status)}
+    registry.inc('yatube_requests_total', labels)
+    registry.observe('yatube_request_duration_seconds', labels, duration)
+    registry.observe('yatube_request_queries', labels, queries)
+
+
+def format_bound(bound):
+    return '+Inf' if bound == math.inf else repr(float(bound))
+
+
+def format_value(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def format_labels(labels):
+    escaped = (
+        (name, str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"'))
+        for name, value in sorted(labels.items())
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def collect(directory):
+    """Sums the values of all the process files in ``directory``, by metric."""
+    samples = defaultdict(lambda: defaultdict(float))
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        for key, value in read_file(path):
+            name, sample, labels = json.loads(key)
+            samples[name][sample, json.dumps(labels, sort_keys=True)] += value
+    return samples
+
+
+def render():
+    """The metrics of all processes in the Prometheus text format."""
+    samples = collect(settings.POSTS_METRICS_DIR)
+    lines = []
+    for name, (kind, description, buckets) in METRICS.items():
+        lines += [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+        values = samples.get(name, {})
+        if kind == 'counter':
+            for (sample, labels), value in sorted(values.items()):
+                lines.append(f'{sample}{format_labels(json.loads(labels))} {format_value(value)}')
+            continue
+        label_sets = sorted({labels for sample, labels in values if sample != f'{name}_bucket'})
+        for labels in label_sets:
+            labels = json.loads(labels)
+            cumulative = 0.0
+            # Every bucket is written, cumulative as the format expects.
+            for bound in buckets:
+                le = format_bound(bound)
+                cumulative += values.get((f'{name}_bucket', json.dumps(dict(labels, le=le), sort_keys=True)), 0)
+                lines.append(f'{name}_bucket{format_labels(dict(labels, le=le))} {format_value(cumulative)}')
+            for sample in (f'{name}_sum', f'{name}_count'):
+                value = values[sample, json.dumps(labels, sort_keys=True)]
+                lines.append(f'{sample}{format_labels(labels)} {format_value(value)}')
+    return '\n'.join(lines) + '\n'
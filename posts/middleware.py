@@ -0,0 +1,180 @@
+import asyncio
+import json
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import metrics, queries, routers, timing
+
+logger = logging.getLogger('posts.timing')
+
+
+class AsyncCapableMiddleware(object):
+    """
+    Base of the middleware running in the mode of the handler.
+
+    Under ASGI, Django runs a middleware that is only sync capable in its one
+    thread for sync code, which serves a request at a time. A subclass handles
+    sync requests in ``__call__()`` and async ones in ``__acall__()``.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Tells the handler that __call__() returns a coroutine, as
+            # django.utils.deprecation.MiddlewareMixin does.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+
+class TimingMiddleware(AsyncCapableMiddleware):
+    """
+    Reports where the time of a sampled request went, see ``posts.timing``.
+
+    A share of ``POSTS_TIMING_SAMPLE_RATE`` requests gets a ``Server-Timing``
+    header and a JSON line in the ``posts.timing`` log. Keep it first in
+    ``MIDDLEWARE``: the total covers the middleware below it.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        timing.install()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= settings.POSTS_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        timings = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.stop()
+        return self.report(request, response, timings)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.POSTS_TIMING_SAMPLE_RATE:
+            return await self.get_response(request)
+        timings = timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.stop()
+        return self.report(request, response, timings)
+
+    def report(self, request, response, timings):
+        if getattr(request, 'view_started', None) is not None:
+            timings.add('view', time.perf_counter() - request.view_started)
+        response['Server-Timing'] = timings.header()
+        logger.info(json.dumps({
+            'method': request.method, 'path': request.path, 'status': response.status_code, **timings.as_dict(),
+        }))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Up to the response, the rendering of a template response included.
+        if timing.get_timings() is not None:
+            request.view_started = time.perf_counter()
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """Adds every request to the metrics of its URL name and status, see ``posts.metrics``."""
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        timing.install()
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        # Counts the queries of the request unless it is timed already.
+        timings = timing.get_timings()
+        if timings is None:
+            timings = timing.start(sampled=False)
+            try:
+                response = self.get_response(request)
+            finally:
+                timing.stop()
+        else:
+            response = self.get_response(request)
+        return self.record(request, response, started, timings)
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        timings = timing.get_timings()
+        if timings is None:
+            timings = timing.start(sampled=False)
+            try:
+                response = await self.get_response(request)
+            finally:
+                timing.stop()
+        else:
+            response = await self.get_response(request)
+        return self.record(request, response, started, timings)
+
+    def record(self, request, response, started, timings):
+        match = request.resolver_match
+        metrics.record_request(
+            match.url_name or match.view_name if match else 'unresolved', response.status_code,
+            time.perf_counter() - started, timings.queries,
+        )
+        return response
+
+
+class QueryDetectorMiddleware(AsyncCapableMiddleware):
+    """Raises or logs the N+1 queries of every request, see ``posts.queries``."""
+
+    def __init__(self, get_response):
+        if not settings.POSTS_QUERY_DETECTOR:
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        with queries.detect(settings.POSTS_QUERY_DETECTOR):
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with queries.detect(settings.POSTS_QUERY_DETECTOR):
+            return await self.get_response(request)
+
+
+class ReplicaMiddleware(AsyncCapableMiddleware):
+    """Routes the reads of the views of ``ReplicaReadMixin`` to a replica, see ``posts.routers``."""
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            # Worker threads serve one request after another.
+            routers.set_read_database(None)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.set_read_database(None)
+        return self.pin(request, response)
+
+    def pin(self, request, response):
+        if getattr(request, 'pin_primary', False):
+            response.set_cookie(
+                settings.POSTS_REPLICA_PIN_COOKIE, '1', max_age=settings.POSTS_REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax',
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if getattr(view_class, 'read_from_replica', False) and request.method in ('GET', 'HEAD'):
+            routers.set_read_database(routers.choose_replica(request))
@@ -0,0 +1,64 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:51
+
+import re
+from collections import Counter
+
+from django.db import migrations, models
+import django.db.models.deletion
+import snowballstemmer
+
+# The tokenizer of posts.search as of this migration, so that later changes
+# to it do not change what the migration does.
+WORD_RE = re.compile(r'\w+')
+STEMMERS = (
+    ('russian', re.compile('[а-я]')),
+    ('english', re.compile('[a-z]')),
+)
+
+
+def tokenize(text, stemmers):
+    for word in WORD_RE.findall(text.lower().replace('ё', 'е')):
+        for stemmer, alphabet in stemmers:
+            if alphabet.search(word):
+                word = stemmer.stemWord(word)
+                break
+        yield word[:64]
+
+
+def fill_search_index(apps, schema_editor):
+    stemmers = [(snowballstemmer.stemmer(algorithm), alphabet) for algorithm, alphabet in STEMMERS]
+    Post = apps.get_model('posts', 'Post')
+    SearchPosting = apps.get_model('posts', 'SearchPosting')
+    for post_id, text in Post.objects.values_list('pk', 'text').iterator():
+        SearchPosting.objects.bulk_create(
+            (
+                SearchPosting(post_id=post_id, term=term, frequency=frequency)
+                for term, frequency in Counter(tokenize(text, stemmers)).items()
+            ),
+            batch_size=500,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64, verbose_name='term')),
+                ('frequency', models.PositiveIntegerField(verbose_name='frequency')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_postings', to='posts.Post', verbose_name='post')),
+            ],
+            options={
+                'verbose_name': 'search posting',
+                'verbose_name_plural': 'search postings',
+                'unique_together': {('term', 'post')},
+            },
+        ),
+        migrations.RunPython(fill_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_content_addressed_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='date of creation')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_events', to='posts.Post', verbose_name='post')),
+            ],
+            options={
+                'verbose_name': 'feed event',
+                'verbose_name_plural': 'feed events',
+            },
+        ),
+    ]
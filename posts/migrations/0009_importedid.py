@@ -0,0 +1,28 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_feedevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedId',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dataset', models.CharField(max_length=16, verbose_name='dataset')),
+                ('source', models.CharField(blank=True, max_length=64, verbose_name='source')),
+                ('external_id', models.BigIntegerField(verbose_name='external id')),
+                ('local_id', models.BigIntegerField(verbose_name='local id')),
+            ],
+            options={
+                'verbose_name': 'imported id',
+                'verbose_name_plural': 'imported ids',
+                'unique_together': {('dataset', 'source', 'external_id')},
+            },
+        ),
+    ]
@@ -1,11 +1,21 @@
+import hashlib
+
 from django.views.generic.base import TemplateResponseMixin
 from django.shortcuts import get_object_or_404
 from django.contrib.auth import get_user_model
 from django.views.generic import ListView
 from django.views.generic.edit import FormMixin
-from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.conf import settings
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+from django.utils.translation import get_language
 
-from .models import Post, Follow
+from . import cache, events, paginators, routers, thumbnails
+from .models import Post, Group, Comment
+from .paginators import CursorPage, CursorPaginator
+from .summary import get_summary
 
 User = get_user_model()
 
@@ -20,36 +30,244 @@ class AuthorMixin(object):
         return self._author
 
 
-class SummaryViewMixin(AuthorMixin, TemplateResponseMixin):
+class GroupMixin(object):
+    _group = None
+
+    @property
+    def group(self):
+        if not self._group or self._group.slug != self.kwargs['slug']:
+            self._group = get_object_or_404(Group, slug=self.kwargs['slug'])
+        return self._group
+
+
+class ParallelLookupsMixin(object):
+    """
+    Lookups of a page that do not depend on each other. Their results are
+    memoized: the async views run them concurrently before rendering, see
+    ``posts.async_views``, the sync views on first use.
+    """
+
+    def get_parallel_lookups(self):
+        return []
+
+
+class SummaryViewMixin(ParallelLookupsMixin, AuthorMixin, TemplateResponseMixin):
+    _summary = None
+
+    def get_summary(self):
+        if self._summary is None:
+            self._summary = get_summary(self.author, self.request.user)
+        return self._summary
+
+    def get_parallel_lookups(self):
+        return super().get_parallel_lookups() + [self.get_summary]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['author'] = self.author
-        context['posts_count'] = Post.objects.filter(author=self.author).count()
-        followers = Follow.objects.filter(author=self.author)
-        if followers.exists():
-            context['followers'] = followers
-            following = followers.filter(user=self.request.user)
-            if following.count() == 1:
-                context['following'] = following[0]
+        context['summary'] = self.get_summary()
+        return context
+
+
+class CommentPageMixin(ParallelLookupsMixin):
+    """
+    A page of the comments of a post, oldest first, after the ``?after=``
+    cursor. Pages are cached until the post or its comments change.
+    """
+    _comments_page = None
+
+    def get_parallel_lookups(self):
+        return super().get_parallel_lookups() + [self.get_comments_page]
+
+    def get_comments_page(self):
+        if self._comments_page is None:
+            self._comments_page = self._get_comments_page(self.kwargs['post_id'])
+        return self._comments_page
+
+    def _get_comments_page(self, post_id):
+        queryset = Comment.objects.filter(post_id=post_id).select_related('author')
+        paginator = CursorPaginator(queryset, settings.POSTS_COMMENTS_PAGE_SIZE, ordering=('created', 'pk'))
+        after = self.request.GET.get('after')
+
+        def load():
+            page = paginator.page(after=after)
+            if not page and not Post.objects.filter(pk=post_id).exists():
+                raise Http404
+            return list(page), page.next_cursor
+
+        try:
+            comments, next_cursor = cache.get_or_set(
+                'comments:page', [f'post:{post_id}'], load, vary=(post_id, after or '')
+            )
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return CursorPage(comments, paginator, next_cursor=next_cursor)
+
+
+class CacheTagsMixin(object):
+    """Puts the version of the cache tags the page depends on into the context."""
+    cache_tags = ()
+    _cache_version = None
+
+    def get_cache_tags(self):
+        return list(self.cache_tags)
+
+    def get_cache_version(self):
+        if self._cache_version is None:
+            self._cache_version = cache.get_version(*self.get_cache_tags())
+        return self._cache_version
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cache_version'] = self.get_cache_version()
+        # The fragments rendered from a replica are its own, see posts.cache.get_timeout().
+        context['cache_database'] = routers.get_read_database()
+        context['cache_timeout'] = cache.get_timeout()
         return context
 
 
-class PostListViewMixin(ListView):
+class ConditionalGetMixin(CacheTagsMixin):
+    """
+    Answers ``304 Not Modified`` while the cache tags of the page are unchanged,
+    before the page query runs. The ETag also depends on the viewer, the
+    language and the query string, which change the page without a tag.
+    Pages without cache tags are always rendered. The pages read from a
+    replica get no ETag: the replica may lag behind the tags.
+    """
+
+    def get_etag(self):
+        parts = [self.get_cache_version(), str(self.request.user.pk), get_language(), self.request.get_full_path()]
+        return quote_etag(hashlib.md5(':'.join(parts).encode()).hexdigest())
+
+    def get_not_modified_response(self):
+        """``304 Not Modified`` when the viewer's copy of the page is current, otherwise ``None``."""
+        if not self.get_cache_tags():
+            return None
+        response = get_conditional_response(self.request, etag=self.get_etag())
+        if response is not None:
+            self.patch_response(response)
+        return response
+
+    def patch_response(self, response):
+        # Pages are personal and have to be revalidated on every visit.
+        patch_cache_control(response, private=True, no_cache=True)
+
+    def get(self, request, *args, **kwargs):
+        if not self.get_cache_tags():
+            return super().get(request, *args, **kwargs)
+        response = self.get_not_modified_response()
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+            if routers.get_read_database() is None:
+                response['ETag'] = self.get_etag()
+            self.patch_response(response)
+        return response
+
+
+class PostListViewMixin(ParallelLookupsMixin, ConditionalGetMixin, ListView):
     model = Post
     paginate_by = 5
+    estimate_count = False
+    cursor_pagination = None
+    cursor_ordering = ('-pub_date', '-pk')
+    _paginated = None
+    _page = None
 
     def get_queryset(self):
         return Post.objects.order_by('-pub_date')
 
+    def use_cursor_pagination(self):
+        if self.cursor_pagination is None:
+            return settings.POSTS_CURSOR_PAGINATION
+        return self.cursor_pagination
+
+    def get_feed_count(self):
+        """Number of posts in the feed when it is known without a query."""
+        return None
+
+    def get_paginator(self, queryset, per_page, orphans=0, allow_empty_first_page=True, **kwargs):
+        paginator = super().get_paginator(queryset, per_page, orphans, allow_empty_first_page, **kwargs)
+        count = self.get_feed_count()
+        paginator.count = paginators.get_count(queryset, self.estimate_count) if count is None else count
+        return paginator
+
+    def get_parallel_lookups(self):
+        return super().get_parallel_lookups() + [self.fetch_page]
+
+    def fetch_page(self):
+        """Fetches the posts of the rendered page."""
+        queryset = self.get_queryset()
+        paginator, page, _, _ = self.paginate_queryset(queryset, self.get_paginate_by(queryset))
+        return len(self.get_rendered_page(paginator, page))
+
+    def get_rendered_page(self, paginator, page):
+        """The page the template renders: out of range page numbers show the last page."""
+        if self.use_cursor_pagination():
+            return page
+        if self._page is None:
+            self._page = paginator.get_page(self.request.GET.get('page'))
+        return self._page
+
+    def paginate_queryset(self, queryset, page_size):
+        if self._paginated is None:
+            self._paginated = self._paginate_queryset(queryset, page_size)
+        return self._paginated
+
+    def _paginate_queryset(self, queryset, page_size):
+        # Everything the post cards render is fetched with the page itself.
+        queryset = queryset.select_related('author', 'group')
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, ordering=self.cursor_ordering)
+        try:
+            page = paginator.page(after=self.request.GET.get('after'), before=self.request.GET.get('before'))
+        except InvalidPage as e:
+            raise Http404(str(e))
+        return paginator, page, page.object_list, page.has_other_pages()
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        page_number = self.request.GET.get('page')
-        context['page'] = context['paginator'].get_page(page_number)
+        context['page'] = self.get_rendered_page(context['paginator'], context['page_obj'])
+        context['event_streams'] = events.is_streamed(self.request)
+        context['new_posts_poll_interval'] = settings.POSTS_NEW_POSTS_POLL_INTERVAL
+        if self.use_cursor_pagination():
+            context['paginator_template'] = 'cursor_paginator.html'
+        else:
+            context['page_window'] = paginators.get_page_window(context['paginator'], context['page'].number)
+            context['paginator_template'] = 'paginator.html'
         return context
 
 
-class ClearCacheMixin(FormMixin):
+class ReplicaReadMixin(object):
+    """Reads the page from a read replica unless the viewer has just written, see ``posts.routers``."""
+    read_from_replica = True
+
+
+class PinPrimaryMixin(FormMixin):
+    """Shows the viewer their own write on the next pages, before the replicas catch up."""
+
+    def form_valid(self, form):
+        response = super(PinPrimaryMixin, self).form_valid(form)
+        routers.pin_primary(self.request)
+        return response
+
+
+class InvalidateCacheMixin(FormMixin):
+
+    def get_invalidated_tags(self, form):
+        return cache.post_tags(form.instance)
+
+    def form_valid(self, form):
+        response = super(InvalidateCacheMixin, self).form_valid(form)
+        cache.invalidate(*self.get_invalidated_tags(form))
+        return response
+
+
+class PregenerateThumbnailsMixin(FormMixin):
+    """Hands the thumbnails of a newly uploaded image to the background workers."""
+
     def form_valid(self, form):
-        cache.clear()
-        return super(ClearCacheMixin, self).form_valid(form)
+        response = super(PregenerateThumbnailsMixin, self).form_valid(form)
+        if 'image' in form.changed_data:
+            thumbnails.schedule(form.instance.image)
+        return response
@@ -2,6 +2,8 @@ from django.db import models
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 
 User = get_user_model()
 
@@ -24,11 +26,20 @@ class Post(models.Model):
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name=_('date published'))
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='post_author', verbose_name=_('author'))
     group = models.ForeignKey(Group, on_delete=models.CASCADE, blank=True, null=True, verbose_name=_('community'))
-    image = models.ImageField(upload_to='posts/', blank=True, null=True, verbose_name=_('image'))
+    image = models.ImageField(
+        upload_to='posts/', storage=ContentAddressedStorage(), blank=True, null=True, db_index=True,
+        verbose_name=_('image')
+    )
+    comments_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('comments count'))
 
     class Meta:
         verbose_name = _('post')
         verbose_name_plural = _('posts')
+        indexes = [
+            models.Index(fields=['-pub_date'], name='posts_post_date'),
+            models.Index(fields=['author', '-pub_date'], name='posts_post_author_date'),
+            models.Index(fields=['group', '-pub_date'], name='posts_post_group_date'),
+        ]
 
     def __str__(self):
         return str(self.text)
@@ -43,6 +54,9 @@ class Comment(models.Model):
     class Meta:
         verbose_name = _('comment')
         verbose_name_plural = _('comments')
+        indexes = [
+            models.Index(fields=['post', 'created'], name='posts_comment_post_created'),
+        ]
 
     def __str__(self):
         return str(self.text)
@@ -56,3 +70,67 @@ class Follow(models.Model):
     class Meta:
         verbose_name = _('follow')
         verbose_name_plural = _('follows')
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'author'], name='posts_follow_unique'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline', verbose_name=_('user'))
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries', verbose_name=_('post'))
+    pub_date = models.DateTimeField(verbose_name=_('date published'))
+
+    class Meta:
+        verbose_name = _('timeline entry')
+        verbose_name_plural = _('timeline entries')
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-pub_date'], name='posts_timeline_user_date'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}:{self.post_id}'
+
+
+class SearchPosting(models.Model):
+    term = models.CharField(max_length=64, verbose_name=_('term'))
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='search_postings', verbose_name=_('post'))
+    frequency = models.PositiveIntegerField(verbose_name=_('frequency'))
+
+    class Meta:
+        verbose_name = _('search posting')
+        verbose_name_plural = _('search postings')
+        # Also the index every search query is served from.
+        unique_together = ('term', 'post')
+
+    def __str__(self):
+        return f'{self.term}:{self.post_id}'
+
+
+class FeedEvent(models.Model):
+    """A published post, read by the feed streams of all workers, see ``posts.events``."""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='feed_events', verbose_name=_('post'))
+    created = models.DateTimeField(auto_now_add=True, db_index=True, verbose_name=_('date of creation'))
+
+    class Meta:
+        verbose_name = _('feed event')
+        verbose_name_plural = _('feed events')
+
+    def __str__(self):
+        return f'{self.pk}:{self.post_id}'
+
+
+class ImportedId(models.Model):
+    """Local id of a row loaded by ``import_posts`` by its id in the dump, see ``posts.bulk``."""
+    dataset = models.CharField(max_length=16, verbose_name=_('dataset'))
+    source = models.CharField(max_length=64, blank=True, verbose_name=_('source'))
+    external_id = models.BigIntegerField(verbose_name=_('external id'))
+    local_id = models.BigIntegerField(verbose_name=_('local id'))
+
+    class Meta:
+        verbose_name = _('imported id')
+        verbose_name_plural = _('imported ids')
+        unique_together = ('dataset', 'source', 'external_id')
+
+    def __str__(self):
+        return f'{self.dataset}:{self.source}:{self.external_id}'
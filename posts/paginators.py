@@ -0,0 +1,170 @@
+import base64
+import collections.abc
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Q
+
+from . import cache as tagged_cache
+
+# Invalidated whenever posts or follows are written, see posts.signals.
+COUNTS_TAG = 'feed-counts'
+
+
+def estimate_count(model, using='default'):
+    """Row count from the planner statistics, ``None`` when unavailable."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [model._meta.db_table])
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+def _count_cache_key(queryset):
+    sql, params = queryset.query.sql_with_params()
+    return tagged_cache.make_key('posts:count', [COUNTS_TAG], sql, params)
+
+
+def get_count(queryset, estimate=False):
+    """
+    Number of rows in ``queryset``, cached per query until posts are written
+    again.
+
+    With ``estimate`` the count of an unfiltered queryset is taken from the
+    database planner statistics (PostgreSQL only) when
+    ``POSTS_PAGINATOR_ESTIMATE_COUNT`` is enabled.
+    """
+    if estimate and settings.POSTS_PAGINATOR_ESTIMATE_COUNT:
+        count = estimate_count(queryset.model, queryset.db)
+        if count is not None:
+            return count
+    try:
+        key = _count_cache_key(queryset)
+    except EmptyResultSet:
+        return 0
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, tagged_cache.get_timeout(settings.POSTS_PAGINATOR_COUNT_TIMEOUT))
+    return count
+
+
+def get_page_window(paginator, number, size=2):
+    """Page numbers of ``paginator`` to render around ``number``, ``None`` marks a gap."""
+    first = max(number - size, 1)
+    last = min(number + size, paginator.num_pages)
+    window = list(range(first, last + 1))
+    if first > 1:
+        window[:0] = [1] if first == 2 else [1, None]
+    if last < paginator.num_pages:
+        window += [paginator.num_pages] if last == paginator.num_pages - 1 else [None, paginator.num_pages]
+    return window
+
+
+class InvalidCursor(InvalidPage):
+    pass
+
+
+class CursorPage(collections.abc.Sequence):
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<CursorPage of %s objects>' % len(self)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator: pages are addressed by opaque ``after``/``before``
+    tokens holding the ordering values of the boundary row, so neither
+    ``OFFSET`` nor ``COUNT(*)`` is ever issued.
+
+    The last ordering field must be unique (the primary key by default).
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-pub_date', '-pk')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+
+    def _fields(self, ordering):
+        for name in ordering:
+            yield name.lstrip('-'), name.startswith('-')
+
+    def _model_field(self, name):
+        opts = self.object_list.model._meta
+        return opts.pk if name == 'pk' else opts.get_field(name)
+
+    def encode_cursor(self, obj):
+        values = [self._model_field(name).value_to_string(obj) for name, _ in self._fields(self.ordering)]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            fields = list(self._fields(self.ordering))
+            if not isinstance(values, list) or len(values) != len(fields):
+                raise ValueError
+            return [self._model_field(name).to_python(value) for (name, _), value in zip(fields, values)]
+        except Exception:
+            raise InvalidCursor('Invalid cursor')
+
+    def _seek(self, ordering, values):
+        """Condition selecting the rows that follow ``values`` in ``ordering``."""
+        condition = Q()
+        equal = {}
+        for (name, descending), value in zip(self._fields(ordering), values):
+            condition |= Q(**equal, **{f'{name}__{"lt" if descending else "gt"}': value})
+            equal[name] = value
+        return condition
+
+    def _reverse(self, ordering):
+        return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+
+    def page(self, after=None, before=None):
+        if before:
+            ordering = self._reverse(self.ordering)
+            queryset = self.object_list.filter(self._seek(ordering, self.decode_cursor(before)))
+        else:
+            ordering = self.ordering
+            queryset = self.object_list
+            if after:
+                queryset = queryset.filter(self._seek(ordering, self.decode_cursor(after)))
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if before:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, bool(after)
+        return CursorPage(
+            rows, self,
+            next_cursor=self.encode_cursor(rows[-1]) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0]) if rows and has_previous else None,
+        )
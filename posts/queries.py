@@ -0,0 +1,137 @@
+"""
+Detection of N+1 queries: the same query shape run again and again in one request.
+
+A shape is the SQL of a ``SELECT`` with its parameters left out and its
+``IN`` lists collapsed, so the lazy ``post.author`` of every card of a feed
+is one shape run once per card. When a shape reaches
+``POSTS_QUERY_REPEAT_THRESHOLD`` runs, the detector raises
+``RepeatedQueriesError`` from the triggering line, or logs it once, with the
+template line and the project frames that ran it. ``QueryDetectorMiddleware``
+checks every request with ``POSTS_QUERY_DETECTOR`` set to ``raise`` or
+``log``; the pytest suite turns it on for every test.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.base import Node
+
+logger = logging.getLogger(__name__)
+
+_detector = ContextVar('query_detector', default=None)
+_installed = False
+_install_lock = threading.Lock()
+
+IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)')
+# Frames of the project, shown in the report, but for the wrappers every
+# request and query runs through.
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WRAPPERS = {
+    os.path.join(PROJECT_DIR, 'posts', name) for name in ('middleware.py', 'queries.py', 'timing.py')
+}
+
+
+class RepeatedQueriesError(Exception):
+    pass
+
+
+def get_shape(sql):
+    return IN_LIST.sub('IN (...)', sql)
+
+
+def get_template_line():
+    """The template line being rendered, if any, as ``name:line``."""
+    frame = sys._getframe()
+    while frame is not None:
+        if frame.f_code is Node.render_annotated.__code__:
+            node = frame.f_locals['self']
+            if getattr(node, 'token', None) is not None:
+                return f'{node.origin.template_name}:{node.token.lineno}'
+        frame = frame.f_back
+    return None
+
+
+def get_project_frames():
+    return [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(PROJECT_DIR) and frame.filename not in WRAPPERS
+        and 'site-packages' not in frame.filename
+    ]
+
+
+class QueryDetector(object):
+    """Counts the query shapes of one request, see ``detect()``."""
+
+    def __init__(self, threshold, action):
+        self.threshold = threshold
+        self.action = action
+        self.shapes = Counter()
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip()[:6].upper() == 'SELECT':
+            shape = get_shape(sql)
+            with self._lock:
+                self.shapes[shape] += 1
+                count = self.shapes[shape]
+            if count == self.threshold:
+                self.report(shape)
+        return execute(sql, params, many, context)
+
+    def report(self, shape):
+        lines = [f'Query repeated {self.threshold} times in one request: {shape}']
+        template_line = get_template_line()
+        if template_line:
+            lines.append(f'Rendering {template_line}')
+        frames = get_project_frames()
+        if frames:
+            lines += ['Run by:', *traceback.format_list(frames[-8:])]
+        message = '\n'.join(line.rstrip('\n') for line in lines)
+        if self.action == 'raise':
+            raise RepeatedQueriesError(message)
+        logger.warning(message)
+
+
+def run_detector(execute, sql, params, many, context):
+    detector = _detector.get()
+    if detector is None:
+        return execute(sql, params, many, context)
+    return detector(execute, sql, params, many, context)
+
+
+def install_detector(sender, connection, **kwargs):
+    if run_detector not in connection.execute_wrappers:
+        connection.execute_wrappers.append(run_detector)
+
+
+def install():
+    """Hooks every database connection, once per process."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+        _installed = True
+    connection_created.connect(install_detector, weak=False)
+    for connection in connections.all():
+        install_detector(None, connection)
+
+
+@contextmanager
+def detect(action='raise', threshold=None):
+    """Detects the repeated queries of the block, run in any thread working on it."""
+    install()
+    detector = QueryDetector(threshold or settings.POSTS_QUERY_REPEAT_THRESHOLD, action)
+    token = _detector.set(detector)
+    try:
+        yield detector
+    finally:
+        _detector.reset(token)
@@ -0,0 +1,68 @@
+"""
+Reads of the feed pages from the read replicas of the primary database.
+
+The views of ``ReplicaReadMixin`` read the models of the posts app from a
+replica chosen for the request, every other query goes to the primary. A
+viewer who has just written is pinned to the primary for
+``POSTS_REPLICA_PIN_SECONDS`` by a cookie, so they see their own post,
+comment or follow while the replicas catch up. The database of the request is
+set by ``ReplicaMiddleware``.
+
+A replica may lag behind the versions of the cache tags: what a request
+reading from a replica caches is kept apart and only for
+``POSTS_REPLICA_CACHE_TIMEOUT``, see ``posts.cache.get_timeout()``, and its
+pages get no ETag, see ``posts.mixins.ConditionalGetMixin``.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Apps whose models are read from the replicas, sessions and users are not.
+REPLICA_APPS = {'posts'}
+
+
+# The database the reads of the current request go to, the primary by default.
+_read_database = ContextVar('read_database', default=None)
+
+
+def get_read_database():
+    return _read_database.get()
+
+
+def set_read_database(alias):
+    _read_database.set(alias)
+
+
+def choose_replica(request):
+    """A replica for the reads of ``request``, ``None`` if the viewer is pinned to the primary."""
+    if not settings.POSTS_DATABASE_REPLICAS or settings.POSTS_REPLICA_PIN_COOKIE in request.COOKIES:
+        return None
+    return random.choice(settings.POSTS_DATABASE_REPLICAS)
+
+
+def pin_primary(request):
+    """Reads the next pages of the viewer of ``request`` from the primary, set on the response."""
+    request.pin_primary = True
+
+
+class ReplicaRouter(object):
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in REPLICA_APPS:
+            return None
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # A replica holds the same rows as the primary: a post read from a
+        # replica may be the author of a follow written to the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema from the primary.
+        if db in settings.POSTS_DATABASE_REPLICAS:
+            return False
+        return None
@@ -0,0 +1,111 @@
+"""
+Full-text search over posts.
+
+The text of every post is split into stemmed terms and kept in an inverted
+index: one ``SearchPosting`` row per term of a post with the number of its
+occurrences. The index is updated whenever a post is saved and its rows go
+away with the post. A query only reads the postings of its own terms through
+the ``(term, post)`` index, results are ranked by TF-IDF.
+"""
+import math
+import re
+import threading
+from collections import Counter
+
+import snowballstemmer
+from django.conf import settings
+from django.db.models import Case, Count, ExpressionWrapper, F, FloatField, Sum, When
+
+from .cache import get_or_set
+from .models import Post, SearchPosting
+from .paginators import COUNTS_TAG
+
+WORD_RE = re.compile(r'\w+')
+TERM_MAX_LENGTH = SearchPosting._meta.get_field('term').max_length
+
+# Snowball algorithm and alphabet for every language of ``LANGUAGES``.
+STEMMERS = {
+    'ru': ('russian', re.compile('[а-я]')),
+    'en': ('english', re.compile('[a-z]')),
+}
+
+_stemmers = threading.local()
+
+
+def _get_stemmer(language):
+    # Snowball stemmers keep state between calls, so they are not shared
+    # between threads.
+    stemmers = _stemmers.__dict__
+    if language not in stemmers:
+        stemmers[language] = snowballstemmer.stemmer(STEMMERS[language][0])
+    return stemmers[language]
+
+
+def stem(word):
+    for language, _ in settings.LANGUAGES:
+        if language in STEMMERS and STEMMERS[language][1].search(word):
+            return _get_stemmer(language).stemWord(word)
+    return word
+
+
+def tokenize(text):
+    """Stemmed terms of ``text`` in order, repeated terms included."""
+    for word in WORD_RE.findall(text.lower().replace('ё', 'е')):
+        yield stem(word)[:TERM_MAX_LENGTH]
+
+
+def index_post(post):
+    """Brings the postings of ``post`` in line with its text."""
+    frequencies = Counter(tokenize(post.text))
+    indexed = dict(SearchPosting.objects.filter(post=post).values_list('term', 'frequency'))
+    stale = [term for term, frequency in indexed.items() if frequencies.get(term) != frequency]
+    if stale:
+        SearchPosting.objects.filter(post=post, term__in=stale).delete()
+    SearchPosting.objects.bulk_create(
+        SearchPosting(post=post, term=term, frequency=frequency)
+        for term, frequency in frequencies.items()
+        if indexed.get(term) != frequency
+    )
+
+
+def index_new_posts(posts):
+    """Indexes posts written without signals, e.g. by the bulk import."""
+    SearchPosting.objects.bulk_create(
+        (
+            SearchPosting(post_id=post.pk, term=term, frequency=frequency)
+            for post in posts
+            for term, frequency in Counter(tokenize(post.text)).items()
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def search(query):
+    """Posts containing every term of ``query``, most relevant first."""
+    terms = set(tokenize(query))
+    if not terms:
+        return Post.objects.none()
+    document_frequencies = dict(
+        SearchPosting.objects.filter(term__in=terms).values('term').annotate(posts=Count('pk')).values_list(
+            'term', 'posts'
+        )
+    )
+    if len(document_frequencies) < len(terms):
+        return Post.objects.none()
+    total = get_or_set('search:total', [COUNTS_TAG], Post.objects.count)
+    weight = Case(
+        *(
+            When(search_postings__term=term, then=ExpressionWrapper(
+                F('search_postings__frequency') * math.log(1 + total / posts), output_field=FloatField()
+            ))
+            for term, posts in document_frequencies.items()
+        ),
+        output_field=FloatField(),
+    )
+    return (
+        Post.objects
+        .filter(search_postings__term__in=terms)
+        .annotate(matched_terms=Count('search_postings'), rank=Sum(weight))
+        .filter(matched_terms=len(terms))
+        .order_by('-rank', '-pub_date', '-pk')
+    )
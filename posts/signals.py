@@ -0,0 +1,92 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in
+
+from . import events, routers, search, timelines
+from .cache import invalidate
+from .counters import change
+from .models import Post, Comment, Follow
+from .paginators import COUNTS_TAG
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        change(User, instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change(User, instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        change(Post, instance.post_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change(Post, instance.post_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, **kwargs):
+    if created:
+        change(User, instance.author_id, 'followers_count', 1)
+        change(User, instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    change(User, instance.author_id, 'followers_count', -1)
+    change(User, instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def push_to_timelines(sender, instance, created, **kwargs):
+    if created:
+        timelines.push_post(instance)
+
+
+@receiver(post_save, sender=Post)
+def publish_to_streams(sender, instance, created, **kwargs):
+    if created:
+        # Streams read the post back, it has to be committed first.
+        transaction.on_commit(lambda: events.publish(instance))
+
+
+@receiver(post_save, sender=Post)
+def update_search_index(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_feed_counts(sender, **kwargs):
+    invalidate(COUNTS_TAG)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, **kwargs):
+    if created:
+        timelines.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timelines.trim(instance.user_id, instance.author_id)
+
+
+@receiver(user_logged_in)
+def pin_new_session(sender, request, **kwargs):
+    # The session has just been written to the primary.
+    routers.pin_primary(request)
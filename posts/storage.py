@@ -0,0 +1,104 @@
+"""
+Content-addressed storage of post images.
+
+A file is stored under the SHA-256 of its content, so identical uploads share
+one file and, since sorl.thumbnail keys thumbnails by the source name, one set
+of thumbnails. A file is not owned by a single post: it is deleted by a
+periodic ``sweep()`` once no post references it any more. Deleting it as soon
+as its last post goes would race with an identical upload that has found the
+file in place and is about to save its post. Until the sweep runs, the
+files of deleted posts stay on disk.
+"""
+import hashlib
+import itertools
+import os
+import posixpath
+import re
+import time
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+from sorl.thumbnail import delete as delete_thumbnails
+from sorl.thumbnail.images import ImageFile
+
+CONTENT_NAME_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.\w+)?$')
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(posixpath.dirname(name), digest[:2], digest[2:4], f'{digest}{extension}')
+
+    def is_content_name(self, name):
+        return bool(CONTENT_NAME_RE.search(name))
+
+    def save(self, name, content, max_length=None):
+        return super().save(self.content_name(name, content), content, max_length)
+
+    def get_available_name(self, name, max_length=None):
+        # A taken name already holds the same content.
+        return name
+
+    def _save(self, name, content):
+        try:
+            # A file in use is touched, so that sweep() leaves it alone.
+            os.utime(self.path(name))
+            return name
+        except FileNotFoundError:
+            return super()._save(name, content)
+
+
+def get_referenced(names):
+    """The ones of ``names`` a post references."""
+    from .models import Post
+
+    return set(Post.objects.filter(image__in=list(names)).values_list('image', flat=True))
+
+
+def get_expired(storage, directory, grace):
+    """Names and paths of the files under ``directory`` not stored or reused for ``grace`` seconds."""
+    root = storage.path(directory)
+    for path, _, files in os.walk(root):
+        for file in files:
+            name = posixpath.join(directory, os.path.relpath(os.path.join(path, file), root).replace(os.sep, '/'))
+            # Files stored before the storage was content-addressed are left alone.
+            if storage.is_content_name(name) and time.time() - os.stat(os.path.join(path, file)).st_mtime >= grace:
+                yield name, os.path.join(path, file)
+
+
+def sweep(storage, directory, grace, batch_size=500):
+    """
+    Deletes the files under ``directory`` that no post references and that
+    have not been stored or reused for ``grace`` seconds, with their
+    thumbnails. Returns the names of the deleted files. References are
+    looked up for ``batch_size`` files at once.
+    """
+    deleted = []
+    expired = get_expired(storage, directory, grace)
+    while True:
+        paths = dict(itertools.islice(expired, batch_size))
+        if not paths:
+            return deleted
+        referenced = get_referenced(paths)
+        # Moved away first: an upload of the same content from now on stores
+        # the file again instead of reusing it.
+        tombstones = {}
+        for name, path in paths.items():
+            if name not in referenced:
+                tombstones[name] = f'{path}.deleted'
+                os.rename(path, tombstones[name])
+        referenced = get_referenced(tombstones) if tombstones else set()
+        for name, tombstone in tombstones.items():
+            if time.time() - os.stat(tombstone).st_mtime < grace or name in referenced:
+                # Reused by an upload that found the file just before.
+                os.replace(tombstone, paths[name])
+                continue
+            os.remove(tombstone)
+            delete_thumbnails(ImageFile(name, storage), delete_file=False)
+            deleted.append(name)
@@ -0,0 +1,221 @@
+"""
+The Server-Sent Events of new posts served by the event loop of an ASGI worker.
+
+An open stream is a subscription of the ``Hub`` of the loop: one task polls the
+events table for all of them and hands every subscription the events of its
+feed, the posts are fetched once per poll and every card is rendered once per
+kind of viewer and language. An idle stream costs a queue and a pending task,
+not a thread. ``EventStreamApp`` answers the stream URLs ahead of Django: the
+handler of Django before 4.2 cannot send a response from a coroutine piece by
+piece. It marks the other requests it passes on, so that their feed pages open
+a stream, see ``posts.events.is_streamed()``.
+"""
+import asyncio
+import logging
+import weakref
+from collections import namedtuple
+from functools import partial
+from importlib import import_module
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib import auth
+from django.core.exceptions import PermissionDenied
+from django.core.handlers.asgi import ASGIRequest
+from django.db import DatabaseError
+from django.http import Http404
+from django.urls import Resolver404, resolve
+from django.utils import translation
+
+from . import events
+from .async_views import run_in_thread
+from .views import FeedEventsView
+
+logger = logging.getLogger(__name__)
+
+Batch = namedtuple('Batch', ['events', 'posts', 'cards'])
+
+
+class Subscription(object):
+    def __init__(self, matches, user, language):
+        self.matches = matches
+        self.user = user
+        self.language = language
+        self.queue = asyncio.Queue()
+        # The id of the last event sent, events may come both from the
+        # backlog and from the hub.
+        self.last_id = 0
+
+    def select(self, batch_events):
+        return [event for event in batch_events if event.id > self.last_id and self.matches(event)]
+
+
+def render_card(post, user, language):
+    with translation.override(language):
+        return events.render_card(post, user)
+
+
+def get_card(cards, post, user, language):
+    """The rendered card of ``post``, shared by the viewers who see the same card."""
+    if user.is_authenticated:
+        kind = 'author' if user.pk == post.author_id else 'user'
+    else:
+        kind = 'anonymous'
+    key = (post.pk, kind, language)
+    if key not in cards:
+        cards[key] = asyncio.ensure_future(run_in_thread(partial(render_card, post, user, language)))
+    return cards[key]
+
+
+class Hub(object):
+    def __init__(self):
+        self.subscriptions = set()
+        self.task = None
+        self.ready = None
+
+    async def subscribe(self, subscription):
+        """Adds ``subscription``, the events published from now on reach it."""
+        self.subscriptions.add(subscription)
+        if self.task is None:
+            self.ready = asyncio.Event()
+            self.task = asyncio.ensure_future(self.run())
+        await self.ready.wait()
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+        if not self.subscriptions and self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self):
+        after = await run_in_thread(events.last_event_id)
+        self.ready.set()
+        while True:
+            try:
+                batch_events = await run_in_thread(partial(events.read_events, after))
+                if batch_events:
+                    after = batch_events[-1].id
+                    await self.deliver(batch_events)
+            except DatabaseError:
+                logger.exception('Failed to read the feed events')
+                batch_events = []
+            if len(batch_events) < events.READ_LIMIT:
+                await asyncio.sleep(settings.POSTS_EVENTS_POLL_INTERVAL)
+
+    async def deliver(self, batch_events):
+        selected = [(subscription, subscription.select(batch_events)) for subscription in self.subscriptions]
+        selected = [(subscription, matching) for subscription, matching in selected if matching]
+        if not selected:
+            return
+        posts = await run_in_thread(partial(events.get_posts, {
+            event for _, matching in selected for event in matching
+        }))
+        cards = {}
+        for subscription, matching in selected:
+            subscription.queue.put_nowait(Batch(matching, posts, cards))
+
+
+_hubs = weakref.WeakKeyDictionary()
+
+
+def get_hub():
+    loop = asyncio.get_running_loop()
+    if loop not in _hubs:
+        _hubs[loop] = Hub()
+    return _hubs[loop]
+
+
+def get_subscription(request, feed, slug):
+    """The subscription of the viewer of ``request``, read as the session middleware would."""
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    user = auth.get_user(request)
+    matches = events.get_feed_filter(feed, user, slug)
+    return Subscription(matches, user, translation.get_language_from_request(request))
+
+
+class EventStreamApp(object):
+    """Serves the streams of ``FeedEventsView``, passes every other request to ``application``."""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            request = ASGIRequest(scope, BytesIO())
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                match = None
+            if match is not None and getattr(match.func, 'view_class', None) is FeedEventsView:
+                feed = match.func.view_initkwargs.get('feed', FeedEventsView.feed)
+                return await self.stream(request, feed, match.kwargs.get('slug'), receive, send)
+        return await self.application(dict(scope, **{events.STREAMS_SCOPE_KEY: True}), receive, send)
+
+    async def stream(self, request, feed, slug, receive, send):
+        try:
+            subscription = await run_in_thread(partial(get_subscription, request, feed, slug))
+        except Http404:
+            return await self.send_status(send, 404)
+        except PermissionDenied:
+            return await self.send_status(send, 403)
+
+        hub = get_hub()
+        disconnect = asyncio.ensure_future(self.wait_for_disconnect(receive))
+        try:
+            await hub.subscribe(subscription)
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+            ]})
+            await self.send_text(send, events.format_retry())
+            after = events.parse_id(request.META.get('HTTP_LAST_EVENT_ID'))
+            if after is not None:
+                await self.replay(subscription, after, send)
+            while not disconnect.done():
+                get = asyncio.ensure_future(subscription.queue.get())
+                await asyncio.wait({get, disconnect}, timeout=settings.POSTS_EVENTS_KEEPALIVE,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if get.done():
+                    await self.send_batch(subscription, get.result(), send)
+                else:
+                    get.cancel()
+                    if not disconnect.done():
+                        await self.send_text(send, events.format_keepalive())
+        finally:
+            disconnect.cancel()
+            hub.unsubscribe(subscription)
+
+    async def replay(self, subscription, after, send):
+        """Sends the events published since ``after`` the client has missed while reconnecting."""
+        subscription.last_id = after
+        while True:
+            batch_events = await run_in_thread(partial(events.read_events, subscription.last_id))
+            matching = subscription.select(batch_events)
+            if matching:
+                posts = await run_in_thread(partial(events.get_posts, matching))
+                await self.send_batch(subscription, Batch(matching, posts, {}), send)
+            if len(batch_events) < events.READ_LIMIT:
+                return
+            subscription.last_id = batch_events[-1].id
+
+    async def send_batch(self, subscription, batch, send):
+        for event in batch.events:
+            post = batch.posts.get(event.post_id)
+            if event.id <= subscription.last_id or post is None:
+                continue
+            html = await get_card(batch.cards, post, subscription.user, subscription.language)
+            await self.send_text(send, events.format_event(event, html))
+            subscription.last_id = event.id
+
+    async def send_text(self, send, text):
+        await send({'type': 'http.response.body', 'body': text.encode(), 'more_body': True})
+
+    async def send_status(self, send, status):
+        await send({'type': 'http.response.start', 'status': status, 'headers': []})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def wait_for_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .cache import get_timeout, make_key
+from .models import Follow
+
+
+class AuthorSummary(object):
+    """Counters shown next to the author's posts and whether the viewer follows the author."""
+
+    def __init__(self, author, follow_on_date=None):
+        self.author = author
+        self.posts_count = author.posts_count
+        self.followers_count = author.followers_count
+        self.following_count = author.following_count
+        self.follow_on_date = follow_on_date
+
+    @property
+    def is_following(self):
+        return self.follow_on_date is not None
+
+
+def get_follow_date(author, viewer):
+    """Date the viewer followed the author, cached per viewer under the author's tag."""
+    if not viewer.is_authenticated or not author.followers_count:
+        return None
+    key = make_key('summary:follow', [f'author:{author.pk}'], author.pk, viewer.pk)
+    follow_on_date = cache.get(key)
+    if follow_on_date is None:
+        follow = Follow.objects.filter(author=author, user=viewer).values_list('follow_on_date', flat=True).first()
+        # False instead of None, so that "not following" is cached too.
+        follow_on_date = follow or False
+        cache.set(key, follow_on_date, get_timeout())
+    return follow_on_date or None
+
+
+def get_summary(author, viewer):
+    """The counters come from the author row itself, only the follow date may need a query."""
+    return AuthorSummary(author, get_follow_date(author, viewer))
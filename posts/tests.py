@@ -1,9 +1,32 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+import django
+from django.conf import settings
+from django.test import RequestFactory, TestCase, TransactionTestCase
 from django.test import Client
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
-
-from posts.models import Post, Group, Follow
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import connection
+from django.template.loader import render_to_string
+
+from posts.models import Post, Group, Comment, Follow, TimelineEntry, SearchPosting
+from posts.summary import get_summary
+from posts import cache as tagged_cache, metrics, paginators, queries, routers, thumbnails, timing, views
+from PIL import Image
 
 User = get_user_model()
 
@@ -386,3 +409,1348 @@ class CommentsTest(TestCase):
             response.redirect_chain, [(f'/auth/login/?next=/{USERNAME}/{post.pk}/comment/', 302)],
             msg='Нет перенаправления на страницу авторизации после попытки публикации нового комментария'
         )
+
+    @override_settings(POSTS_COMMENTS_PAGE_SIZE=2)
+    def test_comment_pages(self):
+        """Проверка постраничной загрузки комментариев, старые первыми"""
+        post = Post.objects.create(text='Текст новой записи', author=self.author)
+        for number in range(3):
+            Comment.objects.create(text=f'Комментарий {number}', author=self.author, post=post)
+
+        response = self.client.get(f'/{USERNAME}/{post.pk}/')
+        first_page = response.context['comment']['page']
+        self.assertEqual(
+            [comment.text for comment in first_page], ['Комментарий 0', 'Комментарий 1'],
+            msg='Неверная первая страница комментариев'
+        )
+        self.assertNotContains(response, 'Комментарий 2', msg_prefix='Страница записи выводит все комментарии')
+
+        response = self.client.get(f'/{USERNAME}/{post.pk}/comments/', {'after': first_page.next_cursor})
+        self.assertContains(response, 'Комментарий 2', msg_prefix='Следующая страница комментариев не загружается')
+        self.assertNotContains(response, 'Комментарий 1', msg_prefix='Страницы комментариев пересекаются')
+        self.assertFalse(response.context['page'].has_next(), msg='После последней страницы есть следующая')
+
+        response = self.client.get(f'/{USERNAME}/{post.pk + 1}/comments/')
+        self.assertEqual(response.status_code, 404, msg='Комментарии несуществующей записи не отвечают 404')
+
+    def test_comment_page_cache(self):
+        """Проверка кэширования страницы комментариев до добавления нового комментария"""
+        post = Post.objects.create(text='Текст новой записи', author=self.author)
+        url = f'/{USERNAME}/{post.pk}/comments/'
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.client.get(url)
+
+        self.client.login(username=USERNAME, password=PASSWORD)
+        self.client.post(f'/{USERNAME}/{post.pk}/comment/', {'text': 'Текст комментария'})
+
+        self.assertContains(
+            self.client.get(url), 'Текст комментария',
+            msg_prefix='Кэш комментариев не сбрасывается после добавления комментария'
+        )
+
+
+class TimelineTest(TestCase):
+    author = None
+    user = None
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.author = User.objects.create_user(username='test_author', email='test_author@test_author.com', password=PASSWORD)
+        self.client.login(username=USERNAME, password=PASSWORD)
+        cache.clear()
+
+    def test_new_post_pushed_to_timeline(self):
+        """Проверка доставки новой записи в ленту подписчика"""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Текст новой записи', author=self.author)
+
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists(),
+            msg='Новая запись не доставлена в ленту подписчика'
+        )
+
+    def test_timeline_backfill_and_trim(self):
+        """Проверка заполнения ленты при подписке и очистки при отписке"""
+        Post.objects.create(text='Текст новой записи', author=self.author)
+        self.client.get(f'/{self.author.username}/follow/')
+
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 1,
+            msg='Лента не заполняется записями автора при подписке'
+        )
+
+        self.client.get(f'/{self.author.username}/unfollow/')
+
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user).exists(),
+            msg='Лента не очищается от записей автора при отписке'
+        )
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1)
+    def test_popular_author_merged_on_read(self):
+        """Проверка чтения записей популярного автора без доставки в ленты"""
+        fan = User.objects.create_user(username='test_fan', email='test_fan@test_fan.com', password=PASSWORD)
+        Follow.objects.create(user=fan, author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        expected_post_text = 'Текст новой записи'
+        Post.objects.create(text=expected_post_text, author=self.author)
+
+        self.assertFalse(
+            TimelineEntry.objects.exists(),
+            msg='Записи популярного автора не должны доставляться в ленты подписчиков'
+        )
+
+        response = self.client.get('/follow/')
+
+        self.assertContains(
+            response, expected_post_text,
+            msg_prefix='Запись популярного автора не отображается в ленте подписчика'
+        )
+
+    @override_settings(TIMELINE_FANOUT_THRESHOLD=1, TIMELINE_PUSH_THRESHOLD=2)
+    def test_author_pushed_again_by_rebuild_timelines(self):
+        """Проверка возврата автора к доставке в ленты только командой rebuild_timelines"""
+        fan = User.objects.create_user(username='test_fan', email='test_fan@test_fan.com', password=PASSWORD)
+        Follow.objects.create(user=fan, author=self.author)
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Текст новой записи', author=self.author)
+        Follow.objects.filter(user=fan).delete()
+
+        self.assertFalse(
+            TimelineEntry.objects.exists(),
+            msg='Записи автора не должны доставляться в ленты при отписке'
+        )
+
+        call_command('rebuild_timelines', '--switch-only', stdout=StringIO())
+
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists(),
+            msg='Команда rebuild_timelines не доставляет записи автора, вернувшегося под порог'
+        )
+
+    def test_rebuild_timelines(self):
+        """Проверка перестроения лент командой rebuild_timelines"""
+        Follow.objects.create(user=self.user, author=self.author)
+        post = Post.objects.create(text='Текст новой записи', author=self.author)
+        TimelineEntry.objects.all().delete()
+
+        call_command('rebuild_timelines', stdout=StringIO())
+
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.user, post=post).exists(),
+            msg='Команда rebuild_timelines не восстанавливает ленты'
+        )
+
+
+@override_settings(POSTS_CURSOR_PAGINATION=True)
+class CursorPaginationTest(TestCase):
+    author = None
+    group = None
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.group = Group.objects.create(title='Новая группа', slug='public')
+        for i in range(7):
+            Post.objects.create(text=f'Запись {i}', author=self.author, group=self.group)
+        cache.clear()
+
+    def test_next_and_previous_pages(self):
+        """Проверка перехода по страницам ленты с помощью курсоров"""
+        response = self.client.get('/group/public/')
+        first_page = [post.text for post in response.context['page']]
+
+        self.assertEqual(
+            first_page, [f'Запись {i}' for i in range(6, 1, -1)],
+            msg='Первая страница ленты сформирована неправильно'
+        )
+        self.assertNotContains(response, '?page=', msg_prefix='Лента с курсорами не должна ссылаться на номера страниц')
+
+        response = self.client.get(f'/group/public/?after={response.context["page"].next_cursor}')
+        page = response.context['page']
+
+        self.assertEqual(
+            [post.text for post in page], ['Запись 1', 'Запись 0'],
+            msg='Следующая страница ленты сформирована неправильно'
+        )
+        self.assertFalse(page.has_next(), msg='После последней страницы ленты не должно быть следующей')
+
+        response = self.client.get(f'/group/public/?before={page.previous_cursor}')
+
+        self.assertEqual(
+            [post.text for post in response.context['page']], first_page,
+            msg='Предыдущая страница ленты сформирована неправильно'
+        )
+        self.assertFalse(response.context['page'].has_previous(), msg='Перед первой страницей ленты не должно быть предыдущей')
+
+    def test_invalid_cursor(self):
+        """Проверка ответа на некорректный курсор"""
+        response = self.client.get('/group/public/?after=invalid')
+
+        self.assertEqual(response.status_code, 404, msg='Нет ошибки при некорректном курсоре')
+
+
+class PaginatorTest(TestCase):
+    author = None
+
+    def setUp(self):
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        Post.objects.bulk_create(Post(text=f'Запись {i}', author=self.author) for i in range(100))
+        cache.clear()
+
+    def test_page_window(self):
+        """Проверка отображения только ближайших к текущей страниц"""
+        paginator = Paginator(Post.objects.order_by('-pub_date'), 5)
+
+        self.assertEqual(paginators.get_page_window(paginator, 1), [1, 2, 3, None, 20], msg='Неверное окно первой страницы')
+        self.assertEqual(
+            paginators.get_page_window(paginator, 10), [1, None, 8, 9, 10, 11, 12, None, 20], msg='Неверное окно страницы'
+        )
+        self.assertEqual(paginators.get_page_window(paginator, 4), [1, 2, 3, 4, 5, 6, None, 20], msg='Неверное окно страницы')
+
+    def test_count_cached_until_post_written(self):
+        """Проверка кэширования количества записей до публикации новой записи"""
+        queryset = Post.objects.filter(author=self.author).order_by('-pub_date')
+        paginators.get_count(queryset)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(paginators.get_count(queryset), 100)
+
+        Post.objects.create(text='Текст новой записи', author=self.author)
+
+        self.assertEqual(
+            paginators.get_count(queryset), 101,
+            msg='Количество записей не обновляется после публикации новой записи'
+        )
+
+
+class TagCacheTest(TestCase):
+    author = None
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.client.login(username=USERNAME, password=PASSWORD)
+        self.group = Group.objects.create(title='Новая группа', slug='public')
+        self.other_group = Group.objects.create(title='Другая группа', slug='other')
+        self.post = Post.objects.create(text='Текст новой записи', author=self.author, group=self.group)
+        self.other_post = Post.objects.create(text='Текст другой записи', author=self.author, group=self.other_group)
+        cache.clear()
+
+    def test_edit_invalidates_touched_pages(self):
+        """Проверка обновления кэша страниц, на которых показана отредактированная запись"""
+        self.client.get('/')
+        self.client.get('/group/public/')
+        expected_post_text = 'Текст новой записи (ред.)'
+        self.client.post(
+            f'/{USERNAME}/{self.post.pk}/edit/', {'text': expected_post_text, 'group': self.group.pk}
+        )
+
+        for url in ('/', '/group/public/', f'/{USERNAME}/'):
+            self.assertContains(
+                self.client.get(url), expected_post_text,
+                msg_prefix=f'Отредактированная запись не отображается на странице {url}'
+            )
+
+    def test_comment_keeps_other_pages_cached(self):
+        """Проверка сохранения кэша страниц, не затронутых комментарием"""
+        self.client.get('/group/other/')
+        Post.objects.filter(pk=self.other_post.pk).update(text='Измененная запись')
+        self.client.post(f'/{USERNAME}/{self.post.pk}/comment/', {'text': 'Текст комментария'})
+
+        self.assertContains(
+            self.client.get('/group/other/'), 'Текст другой записи',
+            msg_prefix='Комментарий не должен сбрасывать кэш страниц других сообществ'
+        )
+        self.assertContains(
+            self.client.get(f'/{USERNAME}/{self.post.pk}/'), 'Текст комментария',
+            msg_prefix='Вновь созданный комментарий не отображается на странице записи'
+        )
+
+
+class SummaryTest(TestCase):
+    author = None
+    user = None
+
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.author = User.objects.create_user(username='test_author', email='test_author@test_author.com', password=PASSWORD)
+        self.client.login(username=USERNAME, password=PASSWORD)
+        Post.objects.create(text='Текст новой записи', author=self.author)
+        Follow.objects.create(user=self.author, author=self.user)
+        cache.clear()
+
+    def test_summary_counters(self):
+        """Проверка счетчиков в карточке автора"""
+        self.client.get(f'/{self.author.username}/follow/')
+        summary = self.client.get(f'/{self.author.username}/').context['summary']
+
+        self.assertEqual(
+            (summary.posts_count, summary.followers_count, summary.following_count), (1, 1, 1),
+            msg='Неверные счетчики в карточке автора'
+        )
+        self.assertTrue(summary.is_following, msg='Не отображается подписка на автора')
+
+    def test_summary_without_counting_queries(self):
+        """Проверка вычисления карточки автора без подсчета записей и подписчиков"""
+        self.client.get(f'/{self.author.username}/follow/')
+        author = User.objects.get(pk=self.author.pk)
+
+        with self.assertNumQueries(1):
+            summary = get_summary(author, self.user)
+        with self.assertNumQueries(0):
+            get_summary(author, self.user)
+
+        self.assertTrue(summary.is_following, msg='Не отображается подписка на автора')
+
+        self.client.get(f'/{self.author.username}/unfollow/')
+        author = User.objects.get(pk=self.author.pk)
+
+        self.assertFalse(
+            get_summary(author, self.user).is_following,
+            msg='Карточка автора не обновляется после отписки'
+        )
+
+
+class CountersTest(TestCase):
+    author = None
+    user = None
+
+    def setUp(self):
+        self.user = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.author = User.objects.create_user(username='test_author', email='test_author@test_author.com', password=PASSWORD)
+
+    def test_counters_follow_writes(self):
+        """Проверка обновления счетчиков при создании и удалении записей, комментариев и подписок"""
+        post = Post.objects.create(text='Текст новой записи', author=self.author)
+        Comment.objects.create(text='Текст комментария', author=self.user, post=post)
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.author.refresh_from_db()
+        self.user.refresh_from_db()
+        post.refresh_from_db()
+
+        self.assertEqual(self.author.posts_count, 1, msg='Не обновляется счетчик записей')
+        self.assertEqual(self.author.followers_count, 1, msg='Не обновляется счетчик подписчиков')
+        self.assertEqual(self.user.following_count, 1, msg='Не обновляется счетчик подписок')
+        self.assertEqual(post.comments_count, 1, msg='Не обновляется счетчик комментариев')
+
+        follow.delete()
+        post.delete()
+        self.author.refresh_from_db()
+        self.user.refresh_from_db()
+
+        self.assertEqual(
+            (self.author.posts_count, self.author.followers_count, self.user.following_count), (0, 0, 0),
+            msg='Счетчики не уменьшаются при удалении'
+        )
+
+    def test_recount(self):
+        """Проверка исправления счетчиков командой recount"""
+        post = Post.objects.create(text='Текст новой записи', author=self.author)
+        Comment.objects.create(text='Текст комментария', author=self.user, post=post)
+        Follow.objects.create(user=self.user, author=self.author)
+        User.objects.update(posts_count=7, followers_count=7, following_count=7)
+        Post.objects.update(comments_count=7)
+
+        call_command('recount', chunk_size=1, stdout=StringIO())
+        self.author.refresh_from_db()
+        self.user.refresh_from_db()
+        post.refresh_from_db()
+
+        self.assertEqual(
+            (self.author.posts_count, self.author.followers_count, self.user.following_count, post.comments_count),
+            (1, 1, 1, 1),
+            msg='Команда recount не исправляет счетчики'
+        )
+
+
+class SearchTest(TestCase):
+    author = None
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        cache.clear()
+
+    def test_search_stems_russian_and_english(self):
+        """Проверка поиска по словоформам на русском и английском"""
+        russian = Post.objects.create(text='Гуляли по набережной с друзьями', author=self.author)
+        english = Post.objects.create(text='Running along the river', author=self.author)
+
+        response = self.client.get('/search/', {'q': 'набережная'})
+        self.assertEqual(list(response.context['page']), [russian], msg='Поиск не находит словоформы на русском')
+        response = self.client.get('/search/', {'q': 'runs'})
+        self.assertEqual(list(response.context['page']), [english], msg='Поиск не находит словоформы на английском')
+
+    def test_search_ranks_and_requires_all_terms(self):
+        """Проверка ранжирования результатов поиска и совпадения всех слов запроса"""
+        once = Post.objects.create(text='Кот спит у собаки', author=self.author)
+        twice = Post.objects.create(text='Кот и еще один кот', author=self.author)
+        Post.objects.create(text='Собака спит на полу', author=self.author)
+
+        response = self.client.get('/search/', {'q': 'кот'})
+        self.assertEqual(list(response.context['page']), [twice, once], msg='Результаты поиска не ранжируются')
+        response = self.client.get('/search/', {'q': 'кот собака'})
+        self.assertEqual(list(response.context['page']), [once], msg='Поиск не требует совпадения всех слов')
+
+    def test_search_index_follows_edits(self):
+        """Проверка обновления поискового индекса при изменении и удалении записи"""
+        post = Post.objects.create(text='Старый текст', author=self.author)
+        post.text = 'Новый текст'
+        post.save()
+
+        self.assertEqual(
+            set(SearchPosting.objects.values_list('term', flat=True)), {'нов', 'текст'},
+            msg='Поисковый индекс не обновляется при изменении записи'
+        )
+        post.delete()
+        self.assertFalse(SearchPosting.objects.exists(), msg='Поисковый индекс не очищается при удалении записи')
+
+    def test_search_pages_keep_query(self):
+        """Проверка сохранения запроса в ссылках постраничной навигации"""
+        for i in range(6):
+            Post.objects.create(text=f'Запись номер {i}', author=self.author)
+
+        response = self.client.get('/search/', {'q': 'запись'})
+
+        self.assertEqual(response.context['paginator'].count, 6, msg='Неверное количество результатов поиска')
+        self.assertContains(response, '?q=%D0%B7%D0%B0%D0%BF%D0%B8%D1%81%D1%8C&amp;page=2',
+                            msg_prefix='Ссылки на страницы результатов поиска теряют запрос')
+
+
+def make_image(size=(100, 100), image_format='JPEG', mode='RGB', color='red', **options):
+    content = BytesIO()
+    Image.new(mode, size, color).save(content, image_format, **options)
+    return content.getvalue()
+
+
+class ThumbnailsTest(TestCase):
+    author = None
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.client.login(username=USERNAME, password=PASSWORD)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+    def test_upload_schedules_thumbnails(self):
+        """Проверка постановки миниатюр в очередь при загрузке изображения"""
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            self.client.post('/new/', {
+                'text': 'Текст новой записи',
+                'image': SimpleUploadedFile('image.jpg', make_image(), content_type='image/jpeg'),
+            })
+            post = Post.objects.get()
+            self.client.post(f'/{USERNAME}/{post.pk}/edit/', {'text': 'Новый текст записи'})
+
+        schedule.assert_called_once()
+        self.assertEqual(
+            schedule.call_args[0][0].name, post.image.name,
+            msg='Миниатюры загруженного изображения не ставятся в очередь'
+        )
+
+    def test_generate_thumbnails(self):
+        """Проверка создания миниатюр всех размеров из шаблонов"""
+        name = default_storage.save('posts/image.jpg', BytesIO(make_image()))
+
+        thumbnails.generate(name, default_storage)
+
+        generated = [
+            file for _, _, files in os.walk(os.path.join(default_storage.location, 'cache')) for file in files
+        ]
+        self.assertEqual(
+            len(generated), len(thumbnails.THUMBNAILS),
+            msg='Не создаются миниатюры загруженного изображения'
+        )
+
+
+class ImageNormalizationTest(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, POSTS_THUMBNAIL_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = Client()
+        User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.client.login(username=USERNAME, password=PASSWORD)
+
+    def upload(self, content, name='image.png'):
+        return self.client.post('/new/', {
+            'text': 'Текст новой записи',
+            'image': SimpleUploadedFile(name, content, content_type='image/png'),
+        })
+
+    @override_settings(POSTS_IMAGE_MAX_SIZE=(200, 200))
+    def test_image_downscaled_and_reencoded(self):
+        """Проверка уменьшения, перекодирования и удаления метаданных загруженного изображения"""
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera'
+        self.upload(make_image((800, 400), 'PNG', mode='RGBA', exif=exif.tobytes()))
+
+        post = Post.objects.get()
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG', msg='Загруженное изображение не перекодируется')
+            self.assertEqual(image.size, (200, 100), msg='Загруженное изображение не уменьшается')
+            self.assertNotIn('exif', image.info, msg='Метаданные загруженного изображения не удаляются')
+        self.assertTrue(post.image.name.endswith('.jpg'), msg='Неверное расширение перекодированного изображения')
+
+    @override_settings(POSTS_IMAGE_MAX_PIXELS=100 * 100)
+    def test_too_large_image_rejected(self):
+        """Проверка отклонения изображений со слишком большим количеством пикселей"""
+        response = self.upload(make_image((101, 100), 'PNG'))
+
+        self.assertFalse(Post.objects.exists(), msg='Слишком большое изображение не отклоняется')
+        self.assertFormError(response, 'form', 'image', 'Изображение слишком большое: 101×100 пикселей.')
+
+    def test_truncated_image_rejected(self):
+        """Проверка отклонения обрезанного изображения"""
+        content = make_image((400, 400), 'JPEG')
+        response = self.upload(content[:len(content) // 2], name='image.jpg')
+
+        self.assertEqual(response.status_code, 200, msg='Обрезанное изображение не отклоняется')
+        self.assertFalse(Post.objects.exists(), msg='Запись с обрезанным изображением сохранена')
+        self.assertFormError(response, 'form', 'image', 'Загрузите правильное изображение.')
+
+
+class ContentAddressedStorageTest(TransactionTestCase):
+    author = None
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(MEDIA_ROOT=media_root.name, POSTS_THUMBNAIL_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+
+    def create_post(self, name, content):
+        post = Post(text='Текст новой записи', author=self.author)
+        post.image.save(name, SimpleUploadedFile(name, content))
+        return post
+
+    def test_identical_images_share_file(self):
+        """Проверка хранения одинаковых изображений в одном файле"""
+        first = self.create_post('first.jpg', make_image())
+        second = self.create_post('second.jpg', make_image())
+        other = self.create_post('first.jpg', make_image(color='blue'))
+
+        self.assertEqual(first.image.name, second.image.name, msg='Одинаковые изображения хранятся в разных файлах')
+        self.assertNotEqual(first.image.name, other.image.name, msg='Разные изображения хранятся в одном файле')
+
+    def test_unreferenced_file_swept(self):
+        """Проверка удаления файла, на который больше не ссылаются записи"""
+        first = self.create_post('first.jpg', make_image())
+        second = self.create_post('second.jpg', make_image())
+        storage = first.image.storage
+        name = first.image.name
+
+        first.delete()
+        call_command('sweep_images', '--grace', '0', stdout=StringIO())
+        self.assertTrue(storage.exists(name), msg='Файл удаляется, пока на него ссылаются другие записи')
+        second.image = self.create_post('other.jpg', make_image(color='blue')).image
+        second.save()
+        call_command('sweep_images', '--grace', '0', stdout=StringIO())
+        self.assertFalse(storage.exists(name), msg='Файл не удаляется, когда на него больше не ссылаются записи')
+
+    def test_sweep_batches_lookups(self):
+        """Проверка поиска ссылок на файлы одним запросом на пачку"""
+        posts = [self.create_post(f'{color}.jpg', make_image(color=color)) for color in ('red', 'green', 'blue')]
+        names = [post.image.name for post in posts]
+        for post in posts:
+            post.delete()
+
+        with CaptureQueriesContext(connection) as context:
+            call_command('sweep_images', '--grace', '0', stdout=StringIO())
+
+        lookups = [query for query in context.captured_queries if 'posts_post' in query['sql']]
+        self.assertEqual(len(lookups), 2, msg='Ссылки на файлы ищутся отдельным запросом на каждый файл')
+        self.assertFalse(any(posts[0].image.storage.exists(name) for name in names), msg='Файлы удалённых записей не удаляются')
+
+    def test_reused_file_not_swept(self):
+        """Проверка сохранения недавно использованного файла"""
+        post = self.create_post('first.jpg', make_image())
+        storage = post.image.storage
+        name = post.image.name
+        path = storage.path(name)
+        os.utime(path, (0, 0))
+        post.delete()
+        self.create_post('second.jpg', make_image()).delete()
+
+        call_command('sweep_images', stdout=StringIO())
+
+        self.assertTrue(storage.exists(name), msg='Удаляется файл, только что использованный другой загрузкой')
+
+
+class ConditionalGetTest(TestCase):
+    author = None
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        cache.clear()
+
+    def test_not_modified_without_page_query(self):
+        """Проверка ответа 304 без запроса записей для неизменившихся страниц"""
+        post = Post.objects.create(text='Текст новой записи', author=self.author)
+
+        for url, num_queries in (('/', 0), (f'/{USERNAME}/', 1), (f'/{USERNAME}/{post.pk}/', 1)):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(num_queries):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, msg=f'Страница {url} не отвечает 304 без изменений')
+
+    def test_modified_after_write(self):
+        """Проверка смены ETag после изменения страницы"""
+        post = Post.objects.create(text='Текст новой записи', author=self.author)
+        urls = ['/', f'/{USERNAME}/', f'/{USERNAME}/{post.pk}/']
+        etags = {url: self.client.get(url)['ETag'] for url in urls}
+
+        self.client.login(username=USERNAME, password=PASSWORD)
+        self.client.post(f'/{USERNAME}/{post.pk}/comment/', {'text': 'Текст комментария'})
+
+        for url in urls:
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etags[url])
+            self.assertEqual(response.status_code, 200, msg=f'Страница {url} отвечает 304 после изменения')
+
+    def test_follower_profile_modified_after_follow(self):
+        """Проверка смены ETag профиля подписчика после подписки и отписки"""
+        author = User.objects.create_user(username='test_author', email='test_author@test_author.com', password=PASSWORD)
+        self.client.login(username=USERNAME, password=PASSWORD)
+
+        for action in ('follow', 'unfollow'):
+            etag = self.client.get(f'/{USERNAME}/')['ETag']
+            self.client.get(f'/{author.username}/{action}/')
+            response = self.client.get(f'/{USERNAME}/', HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200, msg=f'Профиль подписчика отвечает 304 после {action}')
+
+
+class FeedsTest(TestCase):
+    author = None
+    group = None
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.group = Group.objects.create(title='Новая группа', slug='public', description='Описание')
+        cache.clear()
+
+    def read(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, msg=f'Лента {url} недоступна')
+        return b''.join(response.streaming_content if response.streaming else [response.content]).decode()
+
+    def test_feeds_list_posts(self):
+        """Проверка записей в лентах RSS и Atom главной страницы, сообщества и автора"""
+        in_group = Post.objects.create(text='Запись в сообществе', author=self.author, group=self.group)
+        other = Post.objects.create(text='Запись без сообщества', author=self.author)
+
+        for feed_format, item in (('rss', '<item>'), ('atom', '<entry>')):
+            for url, posts in (
+                (f'/feeds/{feed_format}/', [in_group, other]),
+                (f'/group/public/feeds/{feed_format}/', [in_group]),
+                (f'/{USERNAME}/feeds/{feed_format}/', [in_group, other]),
+            ):
+                content = self.read(url)
+                self.assertEqual(content.count(item), len(posts), msg=f'Неверное количество записей в ленте {url}')
+                for post in posts:
+                    self.assertIn(f'/{USERNAME}/{post.pk}/', content, msg=f'Запись не попадает в ленту {url}')
+
+    def test_feed_cached_and_invalidated(self):
+        """Проверка кеширования ленты и его сброса при публикации записи"""
+        Post.objects.create(text='Первая запись', author=self.author)
+        self.assertIn('Первая запись', self.read('/feeds/rss/'), msg='Запись не попадает в ленту')
+
+        Post.objects.create(text='Вторая запись', author=self.author)
+        self.assertNotIn('Вторая запись', self.read('/feeds/rss/'), msg='Лента не кешируется')
+
+        self.client.login(username=USERNAME, password=PASSWORD)
+        self.client.post('/new/', {'text': 'Третья запись'})
+        self.assertIn('Третья запись', self.read('/feeds/rss/'), msg='Кеш ленты не сбрасывается')
+
+    def test_feed_cached_per_language(self):
+        """Проверка кеширования ленты отдельно для каждого языка"""
+        Post.objects.create(text='Текст новой записи', author=self.author)
+        for language in ('ru', 'en', 'ru'):
+            response = self.client.get('/feeds/rss/', HTTP_ACCEPT_LANGUAGE=language)
+            content = b''.join(response.streaming_content if response.streaming else [response.content]).decode()
+            self.assertIn(f'<language>{language}</language>', content, msg=f'Лента на языке {language} не отдаётся')
+            self.assertIn('Accept-Language', response['Vary'], msg='Лента не зависит от языка в заголовке Vary')
+
+    def test_feed_not_modified(self):
+        """Проверка ответа 304 для неизменившейся ленты"""
+        Post.objects.create(text='Текст новой записи', author=self.author)
+        etag = self.client.get('/feeds/atom/')['ETag']
+
+        response = self.client.get('/feeds/atom/', HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304, msg='Лента не отвечает 304 без изменений')
+
+
+@override_settings(POSTS_API_PAGE_SIZE=2)
+class ApiTest(TestCase):
+    author = None
+    group = None
+
+    def setUp(self):
+        self.client = Client()
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.group = Group.objects.create(title='Новая группа', slug='public', description='Описание')
+
+    def test_posts_cursor_pagination(self):
+        """Проверка курсорной постраничной навигации списка записей API"""
+        posts = [Post.objects.create(text=f'Запись {i}', author=self.author, group=self.group) for i in range(3)]
+
+        first = self.client.get('/api/v1/posts/').json()
+        second = self.client.get(first['next']).json()
+
+        self.assertEqual(
+            [post['id'] for post in first['results'] + second['results']], [post.pk for post in reversed(posts)],
+            msg='Неверный порядок записей в API'
+        )
+        self.assertIsNone(second['next'], msg='Лишняя ссылка на следующую страницу API')
+        self.assertEqual(first['results'][0]['author'], {'username': USERNAME, 'name': ''}, msg='Неверный автор')
+        self.assertEqual(first['results'][0]['group'], {'slug': 'public', 'title': 'Новая группа'}, msg='Неверная группа')
+
+    def test_posts_queries_do_not_depend_on_page(self):
+        """Проверка загрузки авторов и групп записей API одним запросом на страницу"""
+        other = User.objects.create_user(username='other_author')
+        Post.objects.create(text='Запись', author=self.author, group=self.group)
+        Post.objects.create(text='Запись', author=other)
+
+        with self.assertNumQueries(3):
+            self.client.get('/api/v1/posts/')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/v1/posts/', {'fields': 'id,text'})
+        self.assertEqual(
+            [set(post) for post in response.json()['results']], [{'id', 'text'}] * 2,
+            msg='Параметр fields не ограничивает поля записей API'
+        )
+
+    def test_unknown_field(self):
+        """Проверка ошибки для неизвестного поля в параметре fields"""
+        response = self.client.get('/api/v1/posts/', {'fields': 'id,password'})
+
+        self.assertEqual(response.status_code, 400, msg='Неизвестное поле не приводит к ошибке')
+
+    def test_post_detail_and_user(self):
+        """Проверка записи с комментариями и карточки автора в API"""
+        post = Post.objects.create(text='Текст записи', author=self.author)
+        Comment.objects.create(text='Текст комментария', author=self.author, post=post)
+
+        response = self.client.get(f'/api/v1/posts/{post.pk}/').json()
+        self.assertEqual(response['post']['text'], 'Текст записи', msg='Неверная запись в API')
+        self.assertEqual(
+            [comment['text'] for comment in response['comments']], ['Текст комментария'],
+            msg='Неверные комментарии записи в API'
+        )
+
+        response = self.client.get(f'/api/v1/users/{USERNAME}/').json()
+        self.assertEqual(response['posts_count'], 1, msg='Неверная карточка автора в API')
+        self.assertEqual(self.client.get('/api/v1/users/unknown/').status_code, 404, msg='Нет ошибки 404 в API')
+
+    def test_follow_requires_authentication(self):
+        """Проверка доступа к ленте подписок API только авторизованным пользователям"""
+        self.assertEqual(self.client.get('/api/v1/follow/posts/').status_code, 401, msg='Лента подписок доступна без входа')
+
+        self.client.login(username=USERNAME, password=PASSWORD)
+        self.assertEqual(self.client.get('/api/v1/follow/posts/').status_code, 200, msg='Лента подписок недоступна')
+
+
+class ExportTest(TestCase):
+    author = None
+    group = None
+
+    def setUp(self):
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.group = Group.objects.create(title='Новая группа', slug='public', description='Описание')
+        output = tempfile.TemporaryDirectory()
+        self.addCleanup(output.cleanup)
+        self.output = output.name
+
+    def export(self, *args, **options):
+        path = os.path.join(self.output, options.pop('name', 'export.ndjson'))
+        call_command('export_posts', *args, output=path, chunk_size=1, stderr=StringIO(), **options)
+        return path
+
+    def test_export_ndjson_with_filters(self):
+        """Проверка выгрузки записей в NDJSON с фильтрами по сообществу и автору"""
+        post = Post.objects.create(text='Запись в сообществе', author=self.author, group=self.group)
+        Post.objects.create(text='Запись без сообщества', author=self.author)
+        Comment.objects.create(text='Текст комментария', author=self.author, post=post)
+
+        with open(self.export('posts', group='public', author=USERNAME), encoding='utf-8') as dump:
+            rows = [json.loads(line) for line in dump]
+        self.assertEqual(len(rows), 1, msg='Выгрузка не учитывает фильтры')
+        self.assertEqual(
+            (rows[0]['id'], rows[0]['author'], rows[0]['group'], rows[0]['text']),
+            (post.pk, USERNAME, 'public', 'Запись в сообществе'),
+            msg='Неверные поля выгруженной записи'
+        )
+
+        with open(self.export('comments'), encoding='utf-8') as dump:
+            self.assertEqual(json.loads(dump.readline())['post'], post.pk, msg='Неверная выгрузка комментариев')
+
+    def test_export_gzipped_csv(self):
+        """Проверка выгрузки подписок в сжатый CSV"""
+        Follow.objects.create(user=User.objects.create_user(username='follower'), author=self.author)
+
+        with gzip.open(self.export('follows', format='csv', name='follows.csv.gz'), 'rt', encoding='utf-8') as dump:
+            rows = list(csv.DictReader(dump))
+
+        self.assertEqual(
+            [(row['user'], row['author']) for row in rows], [('follower', USERNAME)],
+            msg='Неверная выгрузка подписок в CSV'
+        )
+
+
+class ImportTest(TestCase):
+    author = None
+    follower = None
+
+    def setUp(self):
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.follower = User.objects.create_user(username='follower')
+        Follow.objects.create(user=self.follower, author=self.author)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as dump:
+            dump.writelines(f'{line}\n' for line in lines)
+        return path
+
+    def load(self, *args, **options):
+        stderr = StringIO()
+        call_command('import_posts', *args, chunk_size=2, stderr=stderr, **options)
+        return stderr.getvalue()
+
+    def test_import_posts_and_comments(self):
+        """Проверка загрузки записей и комментариев с обновлением счётчиков, лент и поиска"""
+        posts = self.write('posts.ndjson', [
+            json.dumps({'id': 100, 'author': USERNAME, 'group': None, 'text': 'Пушистая кошка',
+                        'pub_date': '2019-01-01T10:00:00+00:00', 'image': None}),
+            json.dumps({'id': 101, 'author': USERNAME, 'group': None, 'text': 'Вторая запись',
+                        'pub_date': '2019-01-02T10:00:00+00:00', 'image': None}),
+            json.dumps({'id': 102, 'author': 'nobody', 'group': None, 'text': 'Чужая запись',
+                        'pub_date': '2019-01-03T10:00:00+00:00', 'image': None}),
+        ])
+        comments = self.write('comments.csv', [
+            'id,post,author,text,created',
+            '200,100,follower,Комментарий,2019-01-04T10:00:00+00:00',
+            ',999,follower,Комментарий к несуществующей записи,',
+        ])
+
+        report = self.load('posts', input=posts)
+        self.load('comments', input=comments)
+
+        self.assertIn('Imported 2 posts, skipped 1', report, msg='Неверный отчёт о загрузке')
+        post = Post.objects.get(text='Пушистая кошка')
+        self.assertEqual(post.pub_date.year, 2019, msg='Дата публикации не сохранена')
+        self.assertEqual(post.comments_count, 1, msg='Не обновлён счётчик комментариев')
+        self.assertEqual(User.objects.get(pk=self.author.pk).posts_count, 2, msg='Не обновлён счётчик записей')
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.follower).count(), 2, msg='Записи не попали в ленту подписчика'
+        )
+        self.assertTrue(SearchPosting.objects.filter(post=post).exists(), msg='Записи не попали в поисковый индекс')
+        self.assertEqual(Comment.objects.get(post=post).created.day, 4, msg='Дата комментария не сохранена')
+
+        self.client.force_login(self.follower)
+        response = self.client.get('/follow/')
+        self.assertContains(response, 'Пушистая кошка', msg_prefix='Загруженная запись не видна в ленте')
+
+    def test_import_assigns_local_ids(self):
+        """Проверка загрузки записей с чужими или отсутствующими идентификаторами и повторной загрузки"""
+        local = Post.objects.create(text='Местная запись', author=self.author)
+        posts = self.write('posts.ndjson', [
+            json.dumps({'id': local.pk, 'author': USERNAME, 'text': 'Запись из выгрузки'}),
+            json.dumps({'author': USERNAME, 'text': 'Запись без идентификатора'}),
+        ])
+        comments = self.write('comments.ndjson', [
+            json.dumps({'id': 1, 'post': local.pk, 'author': 'follower', 'text': 'Комментарий'}),
+        ])
+
+        report = self.load('posts', input=posts)
+        self.load('comments', input=comments)
+
+        self.assertIn('Imported 2 posts, skipped 0', report, msg='Записи с занятыми или без идентификаторов пропущены')
+        imported = Post.objects.get(text='Запись из выгрузки')
+        self.assertEqual(
+            list(Comment.objects.values_list('post', flat=True)), [imported.pk],
+            msg='Комментарий не привязан к загруженной записи'
+        )
+        # A row without an id can not be recognized and is loaded again.
+        self.assertIn(
+            'Imported 1 posts, skipped 1', self.load('posts', input=posts),
+            msg='Повторная загрузка создаёт записи заново'
+        )
+        self.assertIn(
+            'Imported 2 posts, skipped 0', self.load('posts', input=posts, source='other'),
+            msg='Записи другого источника не загружаются'
+        )
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).posts_count, Post.objects.filter(author=self.author).count(),
+            msg='Счётчик записей не совпадает после нескольких загрузок'
+        )
+
+    def test_import_follows(self):
+        """Проверка загрузки подписок с обновлением счётчиков"""
+        follows = self.write('follows.ndjson', [
+            json.dumps({'user': 'follower', 'author': USERNAME, 'follow_on_date': '2019-01-01'}),
+            json.dumps({'user': USERNAME, 'author': 'follower', 'follow_on_date': '2019-01-02'}),
+        ])
+
+        self.assertIn(
+            'Imported 1 follows, skipped 1', self.load('follows', input=follows), msg='Неверный отчёт о загрузке'
+        )
+        for user in User.objects.all():
+            self.assertEqual(
+                (user.followers_count, user.following_count),
+                (Follow.objects.filter(author=user).count(), Follow.objects.filter(user=user).count()),
+                msg='Не обновлены счётчики подписок'
+            )
+        self.assertEqual(
+            Follow.objects.get(user=self.author).follow_on_date.day, 2, msg='Дата подписки не сохранена'
+        )
+
+    def test_import_roundtrip_gzip_with_create_missing(self):
+        """Проверка повторной загрузки сжатой выгрузки с созданием недостающих пользователей и сообществ"""
+        group = Group.objects.create(title='Новая группа', slug='public', description='Описание')
+        Post.objects.create(text='Запись в сообществе', author=self.author, group=group)
+        path = os.path.join(self.directory, 'posts.ndjson.gz')
+        call_command('export_posts', 'posts', output=path, stderr=StringIO())
+        Post.objects.all().delete()
+        group.delete()
+        User.objects.filter(pk=self.author.pk).delete()
+
+        self.load('posts', input=path, create_missing=True)
+
+        post = Post.objects.get()
+        self.assertEqual(
+            (post.text, post.author.username, post.group.slug), ('Запись в сообществе', USERNAME, 'public'),
+            msg='Выгрузка загружена неверно'
+        )
+        self.assertFalse(post.author.has_usable_password(), msg='Созданный пользователь может войти по паролю')
+
+
+# The replica of the tests is the primary itself, the router names it
+# explicitly for the reads of a replica.
+@override_settings(POSTS_DATABASE_REPLICAS=['default'])
+class ReplicaRoutingTest(TestCase):
+    post = None
+
+    def setUp(self):
+        self.client = Client()
+        author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        group = Group.objects.create(title='Новая группа', slug='public', description='Описание')
+        self.post = Post.objects.create(text='Текст новой записи', author=author, group=group)
+        cache.clear()
+        self.reads = []
+        db_for_read = routers.ReplicaRouter.db_for_read
+
+        def record_read(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            if alias is not None:
+                self.reads.append(model._meta.label)
+            return alias
+
+        patcher = mock.patch.object(routers.ReplicaRouter, 'db_for_read', record_read)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, path):
+        """Models read from the replica by the page at ``path``."""
+        self.reads = []
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200, msg=f'Страница {path} не отвечает')
+        self.assertIsNone(routers.get_read_database(), msg='База чтения не сброшена после запроса')
+        return set(self.reads), response
+
+    def test_pages_read_from_replica(self):
+        """Проверка чтения страниц с реплики без ETag"""
+        self.client.login(username=USERNAME, password=PASSWORD)
+        for path in ('/', '/group/public/', f'/{USERNAME}/', f'/{USERNAME}/{self.post.pk}/'):
+            reads, response = self.read(path)
+            self.assertIn('posts.Post', reads, msg=f'Страница {path} читается не с реплики')
+            self.assertFalse(
+                {label for label in reads if not label.startswith('posts.')},
+                msg=f'Страница {path} читает сессии или пользователей с реплики'
+            )
+            self.assertNotIn('ETag', response, msg=f'Страница {path}, прочитанная с реплики, отдаёт ETag')
+        self.assertFalse(self.read('/new/')[0], msg='Форма новой записи читается с реплики')
+
+    def test_replica_cache_kept_apart(self):
+        """Проверка отдельного и короткого кэша прочитанного с реплики"""
+        key = tagged_cache.make_key('page', ['index'])
+        self.assertEqual(tagged_cache.get_timeout(), settings.POSTS_CACHE_TIMEOUT, msg='Неверное время кэша')
+        routers.set_read_database('default')
+        try:
+            self.assertNotEqual(
+                tagged_cache.make_key('page', ['index']), key, msg='Кэш реплики совпадает с кэшем основной базы'
+            )
+            self.assertEqual(
+                tagged_cache.get_timeout(), settings.POSTS_REPLICA_CACHE_TIMEOUT, msg='Кэш реплики хранится долго'
+            )
+        finally:
+            routers.set_read_database(None)
+
+    def test_writes_pin_primary(self):
+        """Проверка чтения своих записей с основной базы"""
+        path = f'/{USERNAME}/{self.post.pk}/'
+        self.client.login(username=USERNAME, password=PASSWORD)
+        response = self.client.post('/new/', {'text': 'Текст новой записи'})
+        self.assertIn(settings.POSTS_REPLICA_PIN_COOKIE, response.cookies, msg='Автор не закреплён за основной базой')
+        self.assertFalse(self.read(path)[0], msg='Автор читает страницу записи с реплики после записи')
+
+        self.client.cookies.pop(settings.POSTS_REPLICA_PIN_COOKIE)
+        self.assertIn('posts.Post', self.read(path)[0], msg='Закрепление за основной базой не снимается')
+
+
+class TimingTest(TestCase):
+
+    def setUp(self):
+        author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        Post.objects.create(text='Текст новой записи', author=author)
+        cache.clear()
+
+    @override_settings(POSTS_TIMING_SAMPLE_RATE=1)
+    def test_server_timing(self):
+        """Проверка заголовка Server-Timing и строки журнала"""
+        with self.assertLogs('posts.timing', 'INFO') as logs:
+            response = self.client.get('/')
+        metrics = dict(metric.split(';', 1) for metric in response['Server-Timing'].split(', '))
+        self.assertEqual(
+            set(metrics), {'sql', 'cache', 'render', 'thumbnails', 'view', 'total'},
+            msg='В заголовке Server-Timing не все показатели'
+        )
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['path'], record['status']), ('/', 200), msg='Неверный запрос в журнале')
+        self.assertGreater(record['queries'], 0, msg='Запросы к базе не посчитаны')
+        self.assertGreater(record['cache_misses'], 0, msg='Промахи кэша не посчитаны')
+        self.assertGreater(record['render_ms'], 0, msg='Время отрисовки шаблона не посчитано')
+        self.assertIn(f'desc="{record["queries"]} queries"', metrics['sql'], msg='Неверное число запросов в заголовке')
+
+        with self.assertLogs('posts.timing', 'INFO') as logs:
+            self.client.get('/')
+        self.assertGreater(json.loads(logs.records[0].getMessage())['cache_hits'], 0, msg='Попадания в кэш не посчитаны')
+
+    @override_settings(POSTS_TIMING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        """Проверка ответа без замеров вне выборки"""
+        self.assertFalse(self.client.get('/').has_header('Server-Timing'), msg='Замеры вне выборки')
+
+    def test_not_sampled_counts_queries(self):
+        """Проверка подсчёта одних запросов к базе вне выборки"""
+        timing.install()
+        timings = timing.start(sampled=False)
+        try:
+            Post.objects.count()
+            cache.get('missing')
+            render_to_string('misc/404.html', {'path': '/'})
+        finally:
+            timing.stop()
+        self.assertEqual(timings.queries, 1, msg='Запросы к базе вне выборки не посчитаны')
+        self.assertEqual(timings.cache_misses, 0, msg='Промахи кэша посчитаны вне выборки')
+        self.assertFalse(any(timings.durations.values()), msg='Время замерено вне выборки')
+
+
+class MetricsTest(TestCase):
+
+    def setUp(self):
+        User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(POSTS_METRICS_DIR=self.directory, POSTS_METRICS_TOKEN='secret')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def get_metrics(self):
+        return self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer secret').content.decode()
+
+    def test_metrics_by_url_name(self):
+        """Проверка метрик запросов по имени адреса и статусу"""
+        self.client.get('/')
+        self.client.get('/')
+        self.client.get(f'/{USERNAME}/')
+        self.client.get('/unknown/')
+        content = self.get_metrics()
+
+        for line in [
+            'yatube_requests_total{status="200",view="index"} 2',
+            'yatube_requests_total{status="200",view="profile"} 1',
+            'yatube_requests_total{status="404",view="profile"} 1',
+            'yatube_request_duration_seconds_bucket{le="+Inf",status="200",view="index"} 2',
+            'yatube_request_duration_seconds_count{status="200",view="index"} 2',
+            'yatube_request_queries_count{status="200",view="profile"} 1',
+        ]:
+            self.assertIn(line, content.splitlines(), msg=f'Нет метрики {line}')
+
+    def test_metrics_of_all_processes(self):
+        """Проверка сложения метрик всех процессов"""
+        self.client.get('/')
+        other_process = metrics.MmapedValues(os.path.join(self.directory, '1.db'))
+        labels = {'view': 'index', 'status': '200'}
+        other_process.add(metrics.make_key('yatube_requests_total', 'yatube_requests_total', labels), 3)
+        other_process.close()
+
+        content = self.get_metrics()
+        self.assertIn(
+            'yatube_requests_total{status="200",view="index"} 4', content.splitlines(),
+            msg='Метрики процессов не сложены'
+        )
+
+    def test_metrics_growing_file(self):
+        """Проверка записи метрик сверх начального размера файла"""
+        values = metrics.MmapedValues(os.path.join(self.directory, '1.db'))
+        keys = [f'yatube_requests_total{{view="view_{number:05}"}}' for number in range(3000)]
+        for key in keys:
+            values.add(key, 1)
+        values.close()
+        self.assertEqual(
+            len(metrics.MmapedValues(os.path.join(self.directory, '1.db'))._positions), len(keys),
+            msg='Метрики потеряны при росте файла'
+        )
+
+    def test_metrics_only_with_token(self):
+        """Проверка недоступности метрик без токена"""
+        for authorization in ('', 'Bearer wrong'):
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION=authorization)
+            self.assertEqual(response.status_code, 404, msg='Метрики доступны без токена')
+        with override_settings(POSTS_METRICS_TOKEN=''):
+            response = self.client.get('/metrics/', HTTP_AUTHORIZATION='Bearer ')
+            self.assertEqual(response.status_code, 404, msg='Метрики доступны без настроенного токена')
+
+
+class QueryDetectorTest(TestCase):
+
+    def setUp(self):
+        for number in range(3):
+            author = User.objects.create_user(username=f'{USERNAME}_{number}')
+            Post.objects.create(text=f'Текст записи {number}', author=author)
+
+    def test_repeated_queries_raise(self):
+        """Проверка ошибки N+1 запросов с указанием строки шаблона"""
+        with self.assertRaises(queries.RepeatedQueriesError, msg='Повторяющиеся запросы не обнаружены') as error:
+            with queries.detect():
+                render_to_string('common/list.html', {'page': Post.objects.order_by('pk')})
+        self.assertIn('common/card.html:', str(error.exception), msg='В ошибке нет строки шаблона')
+
+        with queries.detect():
+            render_to_string('common/list.html', {'page': Post.objects.select_related('author', 'group')})
+
+    def test_repeated_queries_log(self):
+        """Проверка журнала N+1 запросов"""
+        with self.assertLogs('posts.queries', 'WARNING') as logs, queries.detect('log'):
+            authors = [post.author.username for post in Post.objects.all()]
+        self.assertEqual(len(authors), 3)
+        self.assertEqual(len(logs.records), 1, msg='Повторяющийся запрос записан в журнал не один раз')
+
+
+class FeedEventsTest(TransactionTestCase):
+    # Events are published after the post is committed.
+
+    def setUp(self):
+        self.client = Client()
+        User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        self.client.login(username=USERNAME, password=PASSWORD)
+        self.group = Group.objects.create(title='Новая группа', slug='public', description='Описание')
+        Group.objects.create(title='Другая группа', slug='other', description='Описание')
+        cache.clear()
+
+    def count(self, path, after=0):
+        return self.client.get(path, {'after': after}).json()['count']
+
+    def test_new_posts_counted(self):
+        """Проверка подсчёта новых записей лент"""
+        self.client.post('/new/', {'text': 'Запись в сообществе', 'group': self.group.pk})
+        self.client.post('/new/', {'text': 'Запись без сообщества'})
+        newest = Post.objects.latest('pk')
+
+        self.assertEqual(self.count('/feeds/new/'), 2, msg='Новые записи главной страницы не подсчитаны')
+        self.assertEqual(self.count('/group/public/feeds/new/'), 1, msg='Подсчитаны записи других сообществ')
+        self.assertEqual(self.count('/follow/feeds/new/'), 0, msg='Подсчитаны записи неотслеживаемых авторов')
+        self.assertEqual(
+            self.count('/feeds/new/', after=newest.pk), 0, msg='Подсчитаны записи, уже показанные на странице'
+        )
+
+    def test_page_polls_without_event_streams(self):
+        """Проверка опроса числа новых записей страницей, открытой без потоков событий"""
+        response = self.client.get('/')
+
+        self.assertContains(response, '/feeds/new/', msg_prefix='Страница не опрашивает число новых записей')
+        self.assertNotContains(response, 'EventSource', msg_prefix='Страница открывает поток событий без ASGI')
+        self.assertEqual(self.client.get('/feeds/events/').status_code, 404, msg='Поток событий доступен без ASGI')
+
+    def test_new_posts_errors(self):
+        """Проверка подсчёта для неизвестного сообщества и ленты подписок без авторизации"""
+        self.assertEqual(self.client.get('/group/unknown/feeds/new/').status_code, 404)
+        self.client.logout()
+        self.assertEqual(
+            self.client.get('/follow/feeds/new/').status_code, 403,
+            msg='Подсчёт ленты подписок доступен без авторизации'
+        )
+
+
+class AsyncViewsTest(TransactionTestCase):
+    # The lookups run in worker threads, which only see committed rows.
+    author = None
+    post = None
+
+    def setUp(self):
+        self.author = User.objects.create_user(username=USERNAME, email=EMAIL, password=PASSWORD)
+        group = Group.objects.create(title='Новая группа', slug='public', description='Описание')
+        self.post = Post.objects.create(text='Текст новой записи', author=self.author, group=group)
+        Comment.objects.create(text='Текст комментария', author=self.author, post=self.post)
+        cache.clear()
+
+    def request(self, path, **headers):
+        request = RequestFactory().get(path, **headers)
+        request.user = AnonymousUser()
+        return request
+
+    def get(self, view_class, path, **kwargs):
+        from asgiref.sync import async_to_sync
+        from posts.async_views import as_async_view
+
+        return async_to_sync(as_async_view(view_class))(self.request(path), **kwargs)
+
+    def test_async_pages_match_sync_pages(self):
+        """Проверка совпадения асинхронных страниц с синхронными"""
+        pages = [
+            (views.IndexView, '/', {}),
+            (views.GroupView, '/group/public/', {'slug': 'public'}),
+            (views.ProfileView, f'/{USERNAME}/', {'username': USERNAME}),
+            (views.ReadPostView, f'/{USERNAME}/{self.post.pk}/', {'username': USERNAME, 'post_id': self.post.pk}),
+        ]
+        for view_class, path, kwargs in pages:
+            expected = view_class.as_view()(self.request(path), **kwargs).render()
+            response = self.get(view_class, path, **kwargs)
+            self.assertEqual(response.status_code, 200, msg=f'Асинхронная страница {path} не отвечает')
+            self.assertEqual(
+                response.content, expected.content, msg=f'Асинхронная страница {path} отличается от синхронной'
+            )
+            self.assertEqual(response['ETag'], expected['ETag'], msg=f'Неверный ETag асинхронной страницы {path}')
+
+    def test_async_not_modified_and_not_found(self):
+        """Проверка ответов 304 и 404 асинхронных страниц"""
+        from asgiref.sync import async_to_sync
+        from posts.async_views import as_async_view
+
+        path = f'/{USERNAME}/{self.post.pk}/'
+        kwargs = {'username': USERNAME, 'post_id': self.post.pk}
+        etag = self.get(views.ReadPostView, path, **kwargs)['ETag']
+        view = as_async_view(views.ReadPostView)
+        response = async_to_sync(view)(self.request(path, HTTP_IF_NONE_MATCH=etag), **kwargs)
+        self.assertEqual(response.status_code, 304, msg='Асинхронная страница не отвечает 304 без изменений')
+
+        with self.assertRaises(django.http.Http404, msg='Асинхронная страница несуществующей записи не отвечает 404'):
+            self.get(views.ReadPostView, path, username=USERNAME, post_id=self.post.pk + 1)
+
+    @override_settings(POSTS_EVENTS_POLL_INTERVAL=0.01)
+    def test_event_stream(self):
+        """Проверка потока событий на цикле событий ASGI"""
+        from asgiref.sync import async_to_sync, sync_to_async
+        from django.core.asgi import get_asgi_application
+        from posts.streams import EventStreamApp
+
+        application = EventStreamApp(get_asgi_application())
+        messages = []
+
+        async def stream():
+            disconnected = asyncio.Event()
+
+            async def receive():
+                await disconnected.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                messages.append(message)
+                if message.get('body', b'').count(b'event: post') and len(messages) > 3:
+                    disconnected.set()
+                elif message.get('body', b'').count(b'event: post'):
+                    # The backlog is sent, the next post comes from the hub.
+                    await sync_to_async(Post.objects.create)(text='Новая запись', author=self.author)
+
+            scope = {
+                'type': 'http', 'method': 'GET', 'path': '/feeds/events/', 'query_string': b'',
+                'headers': [(b'host', b'testserver'), (b'last-event-id', b'0')],
+            }
+            await asyncio.wait_for(application(scope, receive, send), timeout=10)
+
+        async_to_sync(stream)()
+        body = b''.join(message.get('body', b'') for message in messages).decode()
+        self.assertEqual(messages[0]['status'], 200, msg='Поток событий не отвечает')
+        self.assertIn('Текст новой записи', body, msg='Поток не отправил пропущенную запись')
+        self.assertIn('Новая запись', body, msg='Поток не отправил новую запись')
+
+    @override_settings(POSTS_QUERY_DETECTOR='log', POSTS_TIMING_SAMPLE_RATE=1)
+    def test_middleware_async(self):
+        """Проверка асинхронной работы промежуточных слоёв под ASGI"""
+        from asgiref.sync import async_to_sync
+        from django.core.handlers.asgi import ASGIHandler
+        from posts import middleware
+
+        async def get_response(request):
+            pass
+
+        for middleware_class in (
+            middleware.TimingMiddleware, middleware.MetricsMiddleware,
+            middleware.QueryDetectorMiddleware, middleware.ReplicaMiddleware,
+        ):
+            self.assertTrue(
+                asyncio.iscoroutinefunction(middleware_class(get_response)),
+                msg=f'{middleware_class.__name__} не работает асинхронно'
+            )
+
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': f'/{USERNAME}/{self.post.pk}/', 'query_string': b'',
+            'headers': [(b'host', b'testserver')],
+        }
+        with self.assertLogs('posts.timing', 'INFO'):
+            async_to_sync(ASGIHandler())(scope, receive, send)
+        self.assertEqual(messages[0]['status'], 200, msg='Страница под ASGI не отвечает')
+        self.assertIn(b'Server-Timing', dict(messages[0]['headers']), msg='Под ASGI нет заголовка Server-Timing')
+
+    def test_pages_open_event_streams(self):
+        """Проверка открытия потока событий страницей, обслуженной через EventStreamApp"""
+        from asgiref.sync import async_to_sync
+        from django.core.asgi import get_asgi_application
+        from posts.streams import EventStreamApp
+
+        application = EventStreamApp(get_asgi_application())
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/', 'query_string': b'',
+            'headers': [(b'host', b'testserver')],
+        }
+        async_to_sync(application)(scope, receive, send)
+        body = b''.join(message.get('body', b'') for message in messages).decode()
+        self.assertIn("new EventSource('/feeds/events/')", body, msg='Страница не открывает поток событий')
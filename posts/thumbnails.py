@@ -0,0 +1,71 @@
+"""
+Thumbnail pre-generation.
+
+sorl.thumbnail creates a thumbnail on the first request that renders it. The
+thumbnails of a saved image are instead generated right after the transaction
+commits, by a local pool of ``POSTS_THUMBNAIL_WORKERS`` threads.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from sorl.thumbnail import get_thumbnail
+from sorl.thumbnail.images import ImageFile
+
+logger = logging.getLogger(__name__)
+
+# Geometries and options of every {% thumbnail %} tag rendering post images,
+# keep in line with common/card.html.
+THUMBNAILS = [
+    ('960x339', {'crop': 'center', 'upscale': True}),
+]
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(settings.POSTS_THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+        return _executor
+
+
+def shutdown():
+    """Waits for the scheduled thumbnails, the next ones start a new pool."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def generate(name, storage):
+    """Creates the missing thumbnails of the image ``name``."""
+    source = ImageFile(name, storage)
+    for geometry, options in THUMBNAILS:
+        get_thumbnail(source, geometry, **options)
+
+
+def _generate_in_background(name, storage):
+    try:
+        generate(name, storage)
+    except Exception:
+        logger.exception('Failed to generate thumbnails of %s', name)
+    finally:
+        # The key-value store of sorl.thumbnail opens a connection per thread.
+        connections.close_all()
+
+
+def schedule(image):
+    """Generates the thumbnails of ``image`` once the current transaction commits."""
+    if not image:
+        return
+    name, storage = image.name, image.storage
+    if settings.POSTS_THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: get_executor().submit(_generate_in_background, name, storage))
+    else:
+        transaction.on_commit(lambda: generate(name, storage))
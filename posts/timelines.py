@@ -0,0 +1,147 @@
+"""
+Materialized follow timelines.
+
+Posts of ordinary authors are pushed to every follower's timeline when they
+are published. An author going over ``TIMELINE_FANOUT_THRESHOLD`` followers is
+marked ``timeline_pulled`` and no longer pushed: their posts are merged into
+the follow feed at read time. Switching back means pushing the whole history
+to every follower, so it is left to ``rebuild_timelines`` and only done once
+the author is under the lower ``TIMELINE_PUSH_THRESHOLD``.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Q
+
+from .models import Post, Follow, TimelineEntry
+
+User = get_user_model()
+
+
+def is_pull_author(author_id):
+    return User.objects.filter(pk=author_id, timeline_pulled=True).exists()
+
+
+def pull_authors(user_id):
+    """Authors followed by the user whose posts are merged at read time."""
+    return User.objects.filter(following__user_id=user_id, timeline_pulled=True).values_list('pk', flat=True)
+
+
+def switch_to_pull(author_ids):
+    """Marks the authors gone over ``TIMELINE_FANOUT_THRESHOLD`` as pulled."""
+    User.objects.filter(
+        pk__in=author_ids, timeline_pulled=False, followers_count__gt=settings.TIMELINE_FANOUT_THRESHOLD
+    ).update(timeline_pulled=True)
+
+
+def switch_to_push():
+    """
+    Pushes the history of the pulled authors under ``TIMELINE_PUSH_THRESHOLD``
+    to their followers and marks them as pushed again. Returns their number.
+    """
+    author_ids = User.objects.filter(
+        timeline_pulled=True, followers_count__lt=settings.TIMELINE_PUSH_THRESHOLD
+    ).values_list('pk', flat=True)
+    switched = 0
+    for author_id in list(author_ids):
+        # Marked first, so that the posts published meanwhile are pushed by
+        # push_post(); the entries pushed twice are ignored.
+        User.objects.filter(pk=author_id).update(timeline_pulled=False)
+        for follower_id in Follow.objects.filter(author_id=author_id).values_list('user', flat=True).iterator():
+            with transaction.atomic():
+                _push_history(follower_id, author_id)
+        switched += 1
+    return switched
+
+
+def timeline_queryset(user_id):
+    """Follow feed of the user, newest posts first."""
+    pulled = list(pull_authors(user_id))
+    if not pulled:
+        # Ordered by the entry's own copy of ``pub_date``, so that the feed is
+        # read straight from the ``(user, -pub_date)`` index without sorting.
+        return Post.objects.filter(timeline_entries__user_id=user_id).order_by('-timeline_entries__pub_date')
+    pushed = TimelineEntry.objects.filter(user_id=user_id).values('post')
+    return Post.objects.filter(Q(pk__in=pushed) | Q(author__in=pulled)).order_by('-pub_date')
+
+
+def _bulk_insert(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def _push_history(user_id, author_id):
+    posts = Post.objects.filter(author_id=author_id).values_list('pk', 'pub_date').iterator()
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts
+    )
+
+
+def push_post(post):
+    if is_pull_author(post.author_id):
+        return
+    followers = Follow.objects.filter(author_id=post.author_id).values_list('user', flat=True).iterator()
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+        for user_id in followers
+    )
+
+
+def push_posts(posts):
+    """``push_post()`` for a batch of posts written without signals, e.g. by the bulk import."""
+    pushed = User.objects.filter(
+        pk__in={post.author_id for post in posts}, timeline_pulled=False
+    ).values_list('pk', flat=True)
+    followers = defaultdict(list)
+    for author_id, user_id in Follow.objects.filter(author_id__in=list(pushed)).values_list('author', 'user'):
+        followers[author_id].append(user_id)
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post_id=post.pk, pub_date=post.pub_date)
+        for post in posts
+        for user_id in followers[post.author_id]
+    )
+
+
+def backfill_follows(follows):
+    """``backfill()`` for a batch of follows written without signals, e.g. by the bulk import."""
+    author_ids = {follow.author_id for follow in follows}
+    switch_to_pull(author_ids)
+    pushed = set(User.objects.filter(pk__in=author_ids, timeline_pulled=False).values_list('pk', flat=True))
+    followers = defaultdict(list)
+    for follow in follows:
+        if follow.author_id in pushed:
+            followers[follow.author_id].append(follow.user_id)
+    posts = Post.objects.filter(author_id__in=list(followers)).values_list('pk', 'author', 'pub_date').iterator()
+    _bulk_insert(
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, author_id, pub_date in posts
+        for user_id in followers[author_id]
+    )
+
+
+def backfill(user_id, author_id):
+    switch_to_pull([author_id])
+    if not is_pull_author(author_id):
+        _push_history(user_id, author_id)
+
+
+def trim(user_id, author_id):
+    # An author dropping under the threshold stays pulled until switch_to_push().
+    TimelineEntry.objects.filter(user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild(user_id):
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    pulled = set(pull_authors(user_id))
+    for author_id in Follow.objects.filter(user_id=user_id).values_list('author', flat=True):
+        if author_id not in pulled:
+            _push_history(user_id, author_id)
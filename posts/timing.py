@@ -0,0 +1,207 @@
+"""
+Where the time of a request goes: SQL, cache, template rendering, thumbnails.
+
+``install()`` hooks every database connection, the cache backends, the
+Django template engine and the thumbnail backend once per process. The hooks
+add to the ``Timings`` of the request, kept in a context variable, so the
+worker threads of the async views count for their request too. Only the
+requests sampled by ``TimingMiddleware`` are measured; the other requests only
+count their queries, for ``MetricsMiddleware``, and a hook costs them one
+lookup of the context variable.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template import base
+from django.utils.module_loading import import_string
+
+_timings = ContextVar('timings', default=None)
+# Nested calls of one thread (an included template, the gets of get_many)
+# are counted once, by the outermost call.
+_nesting = threading.local()
+_installed = False
+_install_lock = threading.Lock()
+
+
+class Timings(object):
+    """Counters of one request, updated by the threads working on it."""
+
+    def __init__(self, sampled=True):
+        # Whether the durations and the cache hits are measured, besides the
+        # query count.
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.durations = dict.fromkeys(['sql', 'cache', 'render', 'thumbnails', 'view'], 0.0)
+        self.queries = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._lock = threading.Lock()
+
+    def add(self, name, duration, queries=0, cache_hits=0, cache_misses=0):
+        with self._lock:
+            self.durations[name] += duration
+            self.queries += queries
+            self.cache_hits += cache_hits
+            self.cache_misses += cache_misses
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        """The value of the ``Server-Timing`` header, durations in milliseconds."""
+        descriptions = {
+            'sql': f'{self.queries} queries',
+            'cache': f'{self.cache_hits} hits {self.cache_misses} misses',
+        }
+        metrics = []
+        for name, duration in [*self.durations.items(), ('total', self.total)]:
+            metric = f'{name};dur={duration * 1000:.1f}'
+            if name in descriptions:
+                metric += f';desc="{descriptions[name]}"'
+            metrics.append(metric)
+        return ', '.join(metrics)
+
+    def as_dict(self):
+        return {
+            **{f'{name}_ms': round(duration * 1000, 1) for name, duration in self.durations.items()},
+            'total_ms': round(self.total * 1000, 1),
+            'queries': self.queries,
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+        }
+
+
+def start(sampled=True):
+    timings = Timings(sampled)
+    _timings.set(timings)
+    return timings
+
+
+def stop():
+    _timings.set(None)
+
+
+def get_timings():
+    return _timings.get()
+
+
+def is_sampled():
+    timings = _timings.get()
+    return timings is not None and timings.sampled
+
+
+@contextmanager
+def measure(name, **counts):
+    """Adds the time spent in the block to the metric ``name`` of the current request."""
+    timings = _timings.get()
+    if timings is None or not timings.sampled:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - started, **counts)
+
+
+def timed(name):
+    """Decorator measuring the outermost calls of a function into the metric ``name``."""
+
+    def decorator(function):
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not is_sampled() or getattr(_nesting, name, False):
+                return function(*args, **kwargs)
+            setattr(_nesting, name, True)
+            try:
+                with measure(name):
+                    return function(*args, **kwargs)
+            finally:
+                setattr(_nesting, name, False)
+
+        wrapper.timed = True
+        return wrapper
+
+    return decorator
+
+
+def time_query(execute, sql, params, many, context):
+    timings = _timings.get()
+    if timings is not None and not timings.sampled:
+        timings.add('sql', 0, queries=1)
+        return execute(sql, params, many, context)
+    with measure('sql', queries=1):
+        return execute(sql, params, many, context)
+
+
+def time_queries(sender, connection, **kwargs):
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+_MISSING = object()
+
+
+def time_cache(backend_class):
+    """Counts the hits and misses of the ``get`` and ``get_many`` of ``backend_class``."""
+    get, get_many = backend_class.get, backend_class.get_many
+    if getattr(get, 'timed', False):
+        return
+
+    def timed_get(self, key, default=None, version=None):
+        if not is_sampled() or getattr(_nesting, 'cache', False):
+            return get(self, key, default, version=version)
+        with measure('cache'):
+            value = get(self, key, _MISSING, version=version)
+        hit = value is not _MISSING
+        _timings.get().add('cache', 0, cache_hits=int(hit), cache_misses=int(not hit))
+        return value if hit else default
+
+    def timed_get_many(self, keys, version=None):
+        if not is_sampled() or getattr(_nesting, 'cache', False):
+            return get_many(self, keys, version=version)
+        keys = list(keys)
+        # The default get_many() calls get() for every key.
+        _nesting.cache = True
+        try:
+            with measure('cache'):
+                values = get_many(self, keys, version=version)
+        finally:
+            _nesting.cache = False
+        _timings.get().add('cache', 0, cache_hits=len(values), cache_misses=len(keys) - len(values))
+        return values
+
+    timed_get.timed = True
+    backend_class.get, backend_class.get_many = timed_get, timed_get_many
+
+
+def install():
+    """Hooks the instrumented layers, once per process."""
+    global _installed
+    with _install_lock:
+        if _installed:
+            return
+
+        connection_created.connect(time_queries, weak=False)
+        for connection in connections.all():
+            time_queries(None, connection)
+
+        for options in settings.CACHES.values():
+            time_cache(import_string(options['BACKEND']))
+
+        base.Template.render = timed('render')(base.Template.render)
+
+        from sorl.thumbnail.conf import settings as thumbnail_settings
+        backend_class = import_string(thumbnail_settings.THUMBNAIL_BACKEND)
+        backend_class.get_thumbnail = timed('thumbnails')(backend_class.get_thumbnail)
+
+        # Set last: a request seeing it runs with every hook in place.
+        _installed = True
@@ -1,16 +1,40 @@
-from django.urls import path
+from django.conf import settings
+from django.urls import path, register_converter
+
+from . import feeds, views
+
+register_converter(feeds.FeedFormatConverter, 'feed')
+
+
+def page_view(view_class):
+    """View of a read-heavy page, a coroutine with ``POSTS_ASYNC_VIEWS``."""
+    if not settings.POSTS_ASYNC_VIEWS:
+        return view_class.as_view()
+    from .async_views import as_async_view
+    return as_async_view(view_class)
 
-from . import views
 
 urlpatterns = [
-    path('', views.IndexView.as_view(), name='index'),
+    path('', page_view(views.IndexView), name='index'),
     path('follow/', views.FollowView.as_view(), name='follow'),
+    path('follow/feeds/events/', views.FeedEventsView.as_view(feed='follow'), name='follow_events'),
+    path('follow/feeds/new/', views.NewPostsView.as_view(feed='follow'), name='follow_new_posts'),
+    path('feeds/events/', views.FeedEventsView.as_view(), name='index_events'),
+    path('feeds/new/', views.NewPostsView.as_view(), name='index_new_posts'),
+    path('feeds/<feed:feed_format>/', feeds.IndexFeedView.as_view(), name='index_feed'),
     path('<username>/follow/', views.ProfileFollowView.as_view(), name='profile_follow'),
     path('<username>/unfollow/', views.ProfileUnfollowView.as_view(), name='profile_unfollow'),
     path('new/', views.CreatePostView.as_view(), name='post_create'),
-    path('group/<slug>/', views.GroupView.as_view(), name='group'),
-    path('<username>/', views.ProfileView.as_view(), name='profile'),
-    path('<username>/<int:post_id>/', views.ReadPostView.as_view(), name='post'),
+    path('group/<slug>/', page_view(views.GroupView), name='group'),
+    path('group/<slug>/feeds/events/', views.FeedEventsView.as_view(feed='group'), name='group_events'),
+    path('group/<slug>/feeds/new/', views.NewPostsView.as_view(feed='group'), name='group_new_posts'),
+    path('group/<slug>/feeds/<feed:feed_format>/', feeds.GroupFeedView.as_view(), name='group_feed'),
+    path('search/', views.SearchView.as_view(), name='search'),
+    path('metrics/', views.metrics_view, name='metrics'),
+    path('<username>/', page_view(views.ProfileView), name='profile'),
+    path('<username>/feeds/<feed:feed_format>/', feeds.ProfileFeedView.as_view(), name='profile_feed'),
+    path('<username>/<int:post_id>/', page_view(views.ReadPostView), name='post'),
+    path('<username>/<int:post_id>/comments/', views.CommentsView.as_view(), name='post_comments'),
     path('<username>/<int:post_id>/edit/', views.UpdatePostView.as_view(), name='post_update'),
     path('<username>/<int:post_id>/comment/', views.CreateCommentView.as_view(), name='add_comment')
 ]
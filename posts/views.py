@@ -1,22 +1,31 @@
 from django.shortcuts import render, get_object_or_404
-from django.views.generic import CreateView, DetailView, UpdateView, View
+from django.views.generic import CreateView, DetailView, TemplateView, UpdateView, View
 from django.urls import reverse_lazy
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import redirect
 from django.views.decorators.cache import cache_page
+from django.utils.crypto import constant_time_compare
 from django.utils.decorators import classonlymethod
-from django.http import HttpResponseRedirect
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse
+from django.utils.translation import ngettext
 
+from . import cache, events, metrics, routers, search, timelines
 from .forms import PostForm, CommentForm
-from .mixins import SummaryViewMixin, AuthorMixin, PostListViewMixin, ClearCacheMixin
-from .models import Post, Group, Comment, Follow
+from .mixins import (
+    SummaryViewMixin, AuthorMixin, GroupMixin, PostListViewMixin, InvalidateCacheMixin, ConditionalGetMixin,
+    PregenerateThumbnailsMixin, CommentPageMixin, ReplicaReadMixin, PinPrimaryMixin
+)
+from .models import Post, Follow
 
 User = get_user_model()
 
 
-class IndexView(PostListViewMixin):
+class IndexView(ReplicaReadMixin, PostListViewMixin):
     template_name = 'index.html'
+    estimate_count = True
+    cache_tags = ('index',)
 
     def get_queryset(self):
         return Post.objects.order_by('-pub_date')
@@ -25,12 +34,8 @@ class IndexView(PostListViewMixin):
 class FollowView(LoginRequiredMixin, PostListViewMixin):
     template_name = 'follow.html'
 
-    @property
-    def authors(self):
-        return Follow.objects.filter(user=self.request.user).values_list('author', flat=True)
-
     def get_queryset(self):
-        return Post.objects.filter(author__in=self.authors).order_by('-pub_date')
+        return timelines.timeline_queryset(self.request.user.pk)
 
 
 class ProfileFollowView(LoginRequiredMixin, AuthorMixin, View):
@@ -40,7 +45,11 @@ class ProfileFollowView(LoginRequiredMixin, AuthorMixin, View):
     def get(self, request, *args, **kwargs):
         user = self.request.user
         if user != self.author:
-            Follow.objects.get_or_create(user=user, author=self.author)
+            _, created = Follow.objects.get_or_create(user=user, author=self.author)
+            if created:
+                # Both profiles show the counters of the follow.
+                cache.invalidate(f'author:{self.author.pk}', f'author:{user.pk}')
+                routers.pin_primary(request)
         return HttpResponseRedirect(self.get_success_url())
 
 
@@ -51,18 +60,16 @@ class ProfileUnfollowView(LoginRequiredMixin, AuthorMixin, View):
     def get(self, request, *args, **kwargs):
         following = get_object_or_404(Follow, user=self.request.user, author=self.author)
         following.delete()
+        cache.invalidate(f'author:{self.author.pk}', f'author:{request.user.pk}')
+        routers.pin_primary(request)
         return HttpResponseRedirect(self.get_success_url())
 
 
-class GroupView(PostListViewMixin):
+class GroupView(ReplicaReadMixin, GroupMixin, PostListViewMixin):
     template_name = 'group.html'
-    _group = None
 
-    @property
-    def group(self):
-        if self._group and self._group.slug == self.kwargs['slug']:
-            return self._group
-        return get_object_or_404(Group, slug=self.kwargs['slug'])
+    def get_cache_tags(self):
+        return [f'group:{self.group.pk}']
 
     def get_queryset(self):
         return Post.objects.filter(group=self.group).order_by('-pub_date')
@@ -73,29 +80,111 @@ class GroupView(PostListViewMixin):
         return context
 
 
-class ProfileView(SummaryViewMixin, PostListViewMixin):
+class SearchView(PostListViewMixin):
+    template_name = 'search.html'
+    # Results are ordered by rank, which is not a keyset cursors can seek on.
+    cursor_pagination = False
+
+    @property
+    def query(self):
+        return self.request.GET.get('q', '').strip()
+
+    def get_queryset(self):
+        return search.search(self.query)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['query'] = self.query
+        return context
+
+
+class ProfileView(ReplicaReadMixin, SummaryViewMixin, PostListViewMixin):
     template_name = 'profile.html'
 
+    def get_cache_tags(self):
+        return [f'author:{self.author.pk}']
+
+    def get_feed_count(self):
+        return self.author.posts_count
+
     def get_queryset(self):
         return Post.objects.filter(author=self.author).order_by('-pub_date')
 
 
-class ReadPostView(SummaryViewMixin, DetailView):
+class ReadPostView(ReplicaReadMixin, SummaryViewMixin, CommentPageMixin, ConditionalGetMixin, DetailView):
     model = Post
     form_class = CommentForm
     template_name = 'post.html'
     pk_url_kwarg = 'post_id'
+    object = None
+
+    def get_cache_tags(self):
+        # The summary of the author is rendered next to the post.
+        return [f'post:{self.kwargs["post_id"]}', f'author:{self.author.pk}']
+
+    def get_queryset(self):
+        return Post.objects.select_related('author', 'group')
+
+    def get_object(self, queryset=None):
+        if self.object is None:
+            self.object = super().get_object(queryset)
+        return self.object
+
+    def get_parallel_lookups(self):
+        return super().get_parallel_lookups() + [self.get_object]
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        page = self.get_comments_page()
         context['comment'] = {
-            'items': Comment.objects.filter(post_id=self.kwargs['post_id']),
+            'page': page,
+            'items': page.object_list,
             'form': CommentForm(initial={'post': self.object})
         }
         return context
 
 
-class UpdatePostView(LoginRequiredMixin, ClearCacheMixin, AuthorMixin, UpdateView):
+class CommentsView(ReplicaReadMixin, CommentPageMixin, ConditionalGetMixin, TemplateView):
+    """Further pages of the comments of a post, loaded by the post page."""
+    template_name = 'common/comment_page.html'
+
+    def get_cache_tags(self):
+        return [f'post:{self.kwargs["post_id"]}']
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['page'] = self.get_comments_page()
+        context['items'] = context['page'].object_list
+        return context
+
+
+class FeedEventsView(View):
+    """
+    New posts of the ``feed`` as Server-Sent Events. The streams are served
+    on the event loop by ``posts.streams.EventStreamApp`` under ASGI, a
+    stream would hold a sync worker, so there is none without it.
+    """
+    feed = 'index'
+
+    def get(self, request, *args, **kwargs):
+        raise Http404
+
+
+class NewPostsView(View):
+    """Number of the posts published in the ``feed`` after the ``?after=`` post, polled by its first page."""
+    feed = 'index'
+
+    def get(self, request, *args, **kwargs):
+        count = events.count_new_posts(
+            self.feed, request.user, events.parse_id(request.GET.get('after')) or 0, kwargs.get('slug')
+        )
+        label = ngettext('%(count)s new post', '%(count)s new posts', count) % {'count': count}
+        response = JsonResponse({'count': count, 'label': label})
+        response['Cache-Control'] = 'no-cache'
+        return response
+
+
+class UpdatePostView(LoginRequiredMixin, PinPrimaryMixin, InvalidateCacheMixin, PregenerateThumbnailsMixin, AuthorMixin, UpdateView):
     model = Post
     form_class = PostForm
     template_name = 'new.html'
@@ -109,12 +198,18 @@ class UpdatePostView(LoginRequiredMixin, ClearCacheMixin, AuthorMixin, UpdateVie
     def get_success_url(self):
         return reverse_lazy('post', kwargs={'username': self.author, 'post_id': self.kwargs['post_id']})
 
+    def get_invalidated_tags(self, form):
+        tags = super().get_invalidated_tags(form)
+        if 'group' in form.changed_data and form.initial.get('group'):
+            tags.append(f'group:{form.initial["group"]}')
+        return tags
+
     def form_valid(self, form):
         form.instance.author = self.author
         return super(UpdatePostView, self).form_valid(form)
 
 
-class CreatePostView(LoginRequiredMixin, ClearCacheMixin, CreateView):
+class CreatePostView(LoginRequiredMixin, PinPrimaryMixin, InvalidateCacheMixin, PregenerateThumbnailsMixin, CreateView):
     form_class = PostForm
     success_url = reverse_lazy('index')
     template_name = 'new.html'
@@ -124,18 +219,31 @@ class CreatePostView(LoginRequiredMixin, ClearCacheMixin, CreateView):
         return super(CreatePostView, self).form_valid(form)
 
 
-class CreateCommentView(LoginRequiredMixin, ClearCacheMixin, CreateView):
+class CreateCommentView(LoginRequiredMixin, PinPrimaryMixin, InvalidateCacheMixin, CreateView):
     form_class = CommentForm
 
     def get_success_url(self):
         return reverse_lazy('post', kwargs={'username': self.kwargs['username'], 'post_id': self.kwargs['post_id']})
 
+    def get_invalidated_tags(self, form):
+        # Drops the cached comment pages of the post and the comment counters
+        # shown on the post cards of every feed.
+        return cache.post_tags(form.instance.post)
+
     def form_valid(self, form):
         form.instance.post = get_object_or_404(Post, id=self.kwargs['post_id'])
         form.instance.author = self.request.user
         return super(CreateCommentView, self).form_valid(form)
 
 
+def metrics_view(request):
+    """The request metrics of all worker processes for a scraper holding the token."""
+    token = settings.POSTS_METRICS_TOKEN
+    if not token or not constant_time_compare(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        raise Http404
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def page_not_found(request, exception):
     return render(request, 'misc/404.html', {'path': request.path}, status=404)
 
@@ -9,3 +9,14 @@ def add_class(field, default_class):
     if attrs.get('class'):
         return field.as_widget()
     return field.as_widget(attrs={'class': default_class})
+
+
+@register.simple_tag(takes_context=True)
+def querystring(context, **kwargs):
+    """Current query string with ``kwargs`` replaced, ``None`` drops a parameter."""
+    params = context['request'].GET.copy()
+    for key, value in kwargs.items():
+        params.pop(key, None)
+        if value is not None:
+            params[key] = value
+    return f'?{params.urlencode()}'
@@ -0,0 +1,7 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def detect_repeated_queries(settings):
+    """Fails every request of a test running the same query again and again, see posts.queries."""
+    settings.POSTS_QUERY_DETECTOR = 'raise'
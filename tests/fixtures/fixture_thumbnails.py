@@ -0,0 +1,10 @@
+import pytest
+
+
+@pytest.hookimpl(hookwrapper=True)
+def pytest_runtest_call(item):
+    yield
+    # The test database is torn down next, a thumbnail worker still writing
+    # to it would lock it.
+    from posts import thumbnails
+    thumbnails.shutdown()
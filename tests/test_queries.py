@@ -0,0 +1,66 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Post, Comment, Follow
+
+QUERY_BUDGET = {
+    '/': 4,
+    '/group/test-link/': 5,
+    '/TestAuthor/': 5,
+    '/follow/': 5,
+}
+POST_QUERY_BUDGET = 6
+
+
+def count_queries(client, url):
+    cache.clear()
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200, f'Страница `{url}` работает неправильно'
+    return len(context.captured_queries)
+
+
+def create_posts(author, group, count):
+    for i in range(count):
+        post = Post.objects.create(text=f'Тестовый пост {i}', author=author, group=group)
+        Comment.objects.create(text=f'Тестовый комментарий {i}', author=author, post=post)
+
+
+class TestQueryBudget:
+
+    @pytest.mark.django_db(transaction=True)
+    def test_feed_queries_do_not_depend_on_posts_count(self, user_client, user, group):
+        author = get_user_model().objects.create_user(username='TestAuthor')
+        Follow.objects.create(user=user, author=author)
+
+        create_posts(author, group, 1)
+        single = {url: count_queries(user_client, url) for url in QUERY_BUDGET}
+        create_posts(author, group, 4)
+        full = {url: count_queries(user_client, url) for url in QUERY_BUDGET}
+
+        for url, budget in QUERY_BUDGET.items():
+            assert single[url] == full[url], \
+                f'Количество запросов страницы `{url}` зависит от количества записей: {single[url]} и {full[url]}'
+            assert full[url] <= budget, \
+                f'Страница `{url}` выполняет {full[url]} запросов, допустимо не более {budget}'
+
+    @pytest.mark.django_db(transaction=True)
+    def test_post_queries_do_not_depend_on_comments_count(self, user_client, user):
+        author = get_user_model().objects.create_user(username='TestAuthor')
+        post = Post.objects.create(text='Тестовый пост', author=author)
+        url = f'/{author.username}/{post.id}/'
+
+        Comment.objects.create(text='Тестовый комментарий', author=author, post=post)
+        single = count_queries(user_client, url)
+        for i in range(5):
+            commenter = get_user_model().objects.create_user(username=f'TestCommenter{i}')
+            Comment.objects.create(text=f'Тестовый комментарий {i}', author=commenter, post=post)
+        full = count_queries(user_client, url)
+
+        assert single == full, \
+            f'Количество запросов страницы `/<username>/<post_id>/` зависит от количества комментариев: {single} и {full}'
+        assert full <= POST_QUERY_BUDGET, \
+            f'Страница `/<username>/<post_id>/` выполняет {full} запросов, допустимо не более {POST_QUERY_BUDGET}'
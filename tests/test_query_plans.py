@@ -0,0 +1,83 @@
+import re
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Post, Group, Comment, Follow
+
+FEED_URLS = [
+    '/',
+    '/?page=20',
+    '/group/group-1/',
+    '/author-1/',
+    '/author-1/?page=5',
+    '/follow/',
+    '/follow/?page=10',
+]
+SQLITE_TABLE_SCAN = re.compile(r'\bSCAN (TABLE )?\w+$')
+SQLITE_SORT = 'USE TEMP B-TREE FOR ORDER BY'
+POSTGRESQL_PROBLEMS = ('Seq Scan', 'Sort')
+
+
+def seed(user):
+    authors = [get_user_model().objects.create_user(username=f'author-{i}') for i in range(10)]
+    groups = [Group.objects.create(title=f'Группа {i}', slug=f'group-{i}', description='Описание') for i in range(3)]
+    for author in authors[:5]:
+        Follow.objects.create(user=user, author=author)
+    for i in range(300):
+        post = Post.objects.create(
+            text=f'Тестовый пост {i}', author=authors[i % len(authors)], group=groups[i % len(groups)] if i % 4 else None
+        )
+        if i % 10 == 0:
+            Comment.objects.create(text=f'Тестовый комментарий {i}', author=user, post=post)
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    return post
+
+
+def capture_queries(client, url):
+    cache.clear()
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(url)
+    assert response.status_code == 200, f'Страница `{url}` работает неправильно'
+    return [
+        query['sql'] for query in context.captured_queries
+        if query['sql'].startswith('SELECT') and 'posts_' in query['sql']
+    ]
+
+
+def explain(sql):
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            # Sequential scans and sorts are chosen on small tables even when an
+            # index fits, forbidding them shows whether the index is usable.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            cursor.execute('EXPLAIN ' + sql)
+        else:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [str(row[-1]) for row in cursor.fetchall()]
+
+
+def plan_problems(plan):
+    if connection.vendor == 'postgresql':
+        return [line for line in plan if any(problem in line for problem in POSTGRESQL_PROBLEMS)]
+    return [line for line in plan if SQLITE_TABLE_SCAN.search(line) or SQLITE_SORT in line]
+
+
+class TestQueryPlans:
+
+    @pytest.mark.django_db(transaction=True)
+    def test_feed_queries_use_indexes(self, user_client, user):
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            pytest.skip(f'Планы запросов {connection.vendor} не проверяются')
+        post = seed(user)
+
+        for url in FEED_URLS + [f'/{post.author.username}/{post.id}/']:
+            for sql in capture_queries(user_client, url):
+                problems = plan_problems(explain(sql))
+                assert not problems, \
+                    f'Страница `{url}` выполняет запрос без подходящего индекса: {problems}\n{sql}'
@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    User.objects.filter(followers_count__gt=settings.TIMELINE_FANOUT_THRESHOLD).update(timeline_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='timeline_pulled',
+            field=models.BooleanField(default=False, editable=False, verbose_name='timeline pulled'),
+        ),
+        migrations.RunPython(mark_pulled, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,14 @@
 from django.contrib.auth.models import AbstractUser
+from django.db import models
+from django.utils.translation import gettext_lazy as _
 
 
 class User(AbstractUser):
+    posts_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('posts count'))
+    followers_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('followers count'))
+    following_count = models.PositiveIntegerField(default=0, editable=False, verbose_name=_('following count'))
+    # Posts are merged into the follow feeds at read time, see posts.timelines.
+    timeline_pulled = models.BooleanField(default=False, editable=False, verbose_name=_('timeline pulled'))
 
     def get_full_name(self):
         full_name = '%s %s' % (self.first_name, self.last_name)
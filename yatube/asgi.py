@@ -12,5 +12,13 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+# The read-heavy pages are served by coroutines, see posts.async_views.
+os.environ.setdefault('POSTS_ASYNC_VIEWS', 'true')
 
 application = get_asgi_application()
+
+# The Server-Sent Events of new posts are served on the event loop, see
+# posts.streams.
+from posts.streams import EventStreamApp  # noqa: E402
+
+application = EventStreamApp(application)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import tempfile
 import environ
 env = environ.Env()
 environ.Env.read_env()
@@ -48,6 +49,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'posts.middleware.TimingMiddleware',
+    'posts.middleware.MetricsMiddleware',
+    'posts.middleware.QueryDetectorMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +60,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.middleware.locale.LocaleMiddleware',
+    'posts.middleware.ReplicaMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
@@ -88,6 +93,92 @@ CACHES = {
         }
 }
 
+# Authors with more followers than this are not pushed to follower timelines,
+# their posts are merged into the follow feed at read time instead. They are
+# pushed again by rebuild_timelines once under TIMELINE_PUSH_THRESHOLD, so an
+# author around the threshold does not switch back and forth.
+TIMELINE_FANOUT_THRESHOLD = 1000
+TIMELINE_PUSH_THRESHOLD = 800
+TIMELINE_BATCH_SIZE = 500
+
+# Paginate post feeds with ?after=/?before= cursors instead of page numbers.
+POSTS_CURSOR_PAGINATION = False
+# Take the unfiltered index count from planner statistics (PostgreSQL only).
+POSTS_PAGINATOR_ESTIMATE_COUNT = False
+POSTS_PAGINATOR_COUNT_TIMEOUT = 60 * 60
+
+# Lifetime of cached pages and summaries, they are also invalidated by tags.
+POSTS_CACHE_TIMEOUT = 60 * 5
+
+# Number of the newest posts in RSS and Atom feeds.
+POSTS_FEED_ITEMS = 20
+
+# Serve the feeds, profiles and post pages with the coroutine views of
+# posts.async_views, enabled by yatube/asgi.py. They serve more requests than
+# WSGI workers only while the queries are slow, see benchmarks/pages.py.
+POSTS_ASYNC_VIEWS = env.bool('POSTS_ASYNC_VIEWS', default=False)
+# Threads running the async views, every thread has a database connection of
+# its own, kept between requests for CONN_MAX_AGE seconds.
+POSTS_ASYNC_LOOKUP_THREADS = 32
+
+# Comments rendered on the post page, further pages are loaded on demand.
+POSTS_COMMENTS_PAGE_SIZE = 20
+
+# Server-Sent Events of new posts under ASGI: seconds between polls of the
+# events table, between keepalive comments and for which events are kept for
+# reconnecting clients and polling pages.
+POSTS_EVENTS_POLL_INTERVAL = 1
+POSTS_EVENTS_KEEPALIVE = 15
+POSTS_EVENTS_RETENTION = 60 * 10
+# Seconds between the polls of the number of new posts by a feed page served
+# without event streams.
+POSTS_NEW_POSTS_POLL_INTERVAL = 30
+
+# Share of the requests reporting where their time went in a Server-Timing
+# header and a line of the posts.timing log, 0 turns the timings off.
+POSTS_TIMING_SAMPLE_RATE = env.float('POSTS_TIMING_SAMPLE_RATE', default=0.01)
+
+# Files of the request metrics of every worker process, and the token a
+# scraper sends as "Authorization: Bearer <token>" to read them at /metrics/.
+# The client address is no check: behind a reverse proxy every request comes
+# from the proxy. Without a token /metrics/ answers 404.
+POSTS_METRICS_DIR = env('POSTS_METRICS_DIR', default=os.path.join(tempfile.gettempdir(), 'yatube-metrics'))
+POSTS_METRICS_TOKEN = env('POSTS_METRICS_TOKEN', default='')
+
+# What to do with a query run POSTS_QUERY_REPEAT_THRESHOLD times in one
+# request, the sign of an N+1 lookup: "raise", "log" or nothing.
+POSTS_QUERY_DETECTOR = env('POSTS_QUERY_DETECTOR', default='log' if DEBUG else '')
+POSTS_QUERY_REPEAT_THRESHOLD = 3
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'posts.timing': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+# Page size of the JSON API lists.
+POSTS_API_PAGE_SIZE = 20
+
+# Threads generating the thumbnails of uploaded images in the background,
+# 0 generates them inside the request.
+POSTS_THUMBNAIL_WORKERS = 2
+
+# Uploaded images are downscaled to fit this box and re-encoded as JPEG,
+# images with more pixels than POSTS_IMAGE_MAX_PIXELS are rejected.
+POSTS_IMAGE_MAX_SIZE = (1920, 1920)
+POSTS_IMAGE_MAX_PIXELS = 50 * 10 ** 6
+POSTS_IMAGE_QUALITY = 85
+# Images no post references are deleted by the sweep_images command once they
+# have not been stored or reused for this many seconds. The files of deleted
+# posts stay on disk until then: run the command periodically, e.g. hourly
+# from cron.
+POSTS_IMAGE_SWEEP_GRACE = 24 * 60 * 60
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
@@ -98,6 +189,23 @@ DATABASES = {
     'default': env.db(), # описываем, где искать настройки доступа к базе
 }
 
+# Read replicas of the primary, e.g.
+# DATABASE_REPLICA_URLS=postgres://replica-1/yatube,postgres://replica-2/yatube,
+# or a copy of the SQLite file of the primary to try it locally. Tests read
+# the test database of the primary.
+for number, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), 1):
+    DATABASES[f'replica{number}'] = dict(env.db_url_config(url), TEST={'MIRROR': 'default'})
+POSTS_DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['posts.routers.ReplicaRouter']
+
+# Seconds a viewer reads from the primary after a write, longer than the lag
+# of the replicas.
+POSTS_REPLICA_PIN_SECONDS = 10
+POSTS_REPLICA_PIN_COOKIE = 'pin_primary'
+# Seconds the cache keeps what was read from a replica: one lagging behind a
+# write may have been read after the write invalidated the cache.
+POSTS_REPLICA_CACHE_TIMEOUT = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -118,6 +226,10 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 AUTH_USER_MODEL = 'users.User'
+
+# Keeps the integer ids of the existing tables.
+DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
+
 # Internationalization
 # https://docs.djangoproject.com/en/3.0/topics/i18n/
 
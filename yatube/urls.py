@@ -28,6 +28,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('about-author/', views.flatpage, {'url': '/about-author/'}, name='about'),
     path('about-spec/', views.flatpage, {'url': '/about-spec/'}, name='spec'),
+    path('api/v1/', include('posts.api_urls')),
     path('', include('posts.urls')),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),